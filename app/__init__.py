@@ -14,15 +14,8 @@ _paths_to_add = [
     os.path.join(_root_dir, 'cosyvoice_original', 'third_party', 'Matcha-TTS')
 ]
 
+_sys_path_set = set(sys.path)
 for _path in _paths_to_add:
-    if os.path.exists(_path) and _path not in sys.path:
+    if _path not in _sys_path_set and os.path.isdir(_path):
         sys.path.insert(0, _path)
-
-# Also set PYTHONPATH environment variable
-_current_pythonpath = os.environ.get('PYTHONPATH', '')
-_new_paths = [p for p in _paths_to_add if p not in _current_pythonpath.split(os.pathsep)]
-if _new_paths:
-    if _current_pythonpath:
-        os.environ['PYTHONPATH'] = os.pathsep.join(_new_paths + [_current_pythonpath])
-    else:
-        os.environ['PYTHONPATH'] = os.pathsep.join(_new_paths)
+        _sys_path_set.add(_path)
@@ -0,0 +1,124 @@
+"""
+Shared helpers for synthesis API endpoints
+"""
+
+import asyncio
+import functools
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+import soundfile as sf
+import torch
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import ORJSONResponse
+
+from app.core.async_synthesis_manager import AsyncTask, task_status_payload
+from app.core.embedding_cache import VoiceEmbeddingCache
+from app.core.synthesis_engine import resample_prompt_speech
+from app.core.exceptions import SynthesisError, VoiceNotFoundError, ModelNotReadyError, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+# Chunk size for streaming uploaded prompt audio
+PROMPT_AUDIO_CHUNK_SIZE = 1024 * 1024
+
+# (exception type, HTTP status code) for synthesis endpoints, checked in order
+_STATUS = (
+    (VoiceNotFoundError, 404),
+    (ModelNotReadyError, 503),
+    (QueueFullError, 429),
+    (SynthesisError, 500),
+    (ValueError, 400),
+)
+
+
+def _orjson_default(obj: Any) -> Any:
+    """Serialize objects orjson does not handle natively"""
+    if isinstance(obj, AsyncTask):
+        return task_status_payload(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class TaskJSONResponse(ORJSONResponse):
+    """ORJSONResponse that serializes AsyncTask objects directly as task status"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default)
+
+
+def _hash_prompt_audio(file) -> Tuple[str, int]:
+    """Hash the spooled upload in one pass; returns (digest, size)"""
+    file.seek(0)
+    hasher = hashlib.blake2b(digest_size=16)
+    size = 0
+    while chunk := file.read(PROMPT_AUDIO_CHUNK_SIZE):
+        hasher.update(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def _decode_prompt_audio(file) -> torch.Tensor:
+    """Decode audio into mono 16kHz prompt speech, like cosyvoice's load_wav"""
+    file.seek(0)
+    # libsndfile dequantizes integer PCM straight into the float32 buffer
+    wav, sample_rate = sf.read(file, dtype='float32', always_2d=True)
+    wav = torch.from_numpy(wav)
+    # Mono input is used as a view; only multi-channel input pays for the downmix
+    speech = wav[:, 0] if wav.shape[1] == 1 else wav.mean(dim=1)
+    return resample_prompt_speech(speech.unsqueeze(0), sample_rate)
+
+
+async def read_prompt_audio(
+    prompt_audio: UploadFile, embedding_cache: VoiceEmbeddingCache
+) -> Tuple[str, Optional[Dict[str, Any]], Optional[torch.Tensor]]:
+    """
+    Hash uploaded prompt audio and decode it only on a cache miss
+    Returns: (content hash, cached prompt features, decoded 16kHz prompt speech)
+    """
+    # Starlette reports the spooled size up front; reject empty parts without reading
+    if prompt_audio.size == 0:
+        raise HTTPException(status_code=400, detail="Empty audio file")
+
+    # Read the spooled file in a worker thread: one hop instead of one per chunk
+    loop = asyncio.get_running_loop()
+    prompt_audio_key, size = await loop.run_in_executor(None, _hash_prompt_audio, prompt_audio.file)
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty audio file")
+
+    # On a cache hit the audio is never decoded; on a miss decode it here, off the model worker
+    prompt_features = await embedding_cache.get(prompt_audio_key)
+    if prompt_features is not None:
+        return prompt_audio_key, prompt_features, None
+
+    try:
+        prompt_speech_16k = await loop.run_in_executor(None, _decode_prompt_audio, prompt_audio.file)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid audio file: {str(e)}")
+    return prompt_audio_key, None, prompt_speech_16k
+
+
+def _to_http(e: Exception) -> HTTPException:
+    """Map an exception raised by a synthesis endpoint to an HTTPException"""
+    if isinstance(e, HTTPException):
+        return e
+    for exc_type, status_code in _STATUS:
+        if isinstance(e, exc_type):
+            logger.error("Synthesis request failed: %s", e)
+            return HTTPException(status_code=status_code, detail=str(e))
+    logger.exception("Unexpected error in synthesis request: %s", e)
+    return HTTPException(status_code=500, detail="Internal server error")
+
+
+def handle_synthesis_errors(func):
+    """Translate exceptions raised by an endpoint into HTTPExceptions via _to_http"""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            raise _to_http(e) from e
+
+    return wrapper
@@ -4,60 +4,47 @@ Simplified API focused on cross-lingual voice cloning functionality
 """
 
 import logging
-import tempfile
 import os
-from datetime import datetime
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
-from fastapi.responses import FileResponse
+from functools import lru_cache
+from typing import Annotated
+
+import aiofiles.os
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Form, Request
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 
 from app.models.synthesis import (
-    CrossLingualWithAudioRequest, CrossLingualWithCacheRequest,
+    CrossLingualWithAudioForm, CrossLingualWithAudioRequest, CrossLingualWithCacheRequest,
     CrossLingualAsyncRequest, AsyncTaskResponse, AsyncTaskStatusResponse,
-    SynthesisResponse, AudioFormat
+    SynthesisResponse
 )
-from app.core.voice_manager import VoiceManager
 from app.core.synthesis_engine import SynthesisEngine
-from app.core.async_synthesis_manager import AsyncSynthesisManager, TaskStatus
-from app.core.exceptions import (
-    SynthesisError, VoiceNotFoundError, ModelNotReadyError
-)
+from app.core.async_synthesis_manager import AsyncSynthesisManager, TaskStatus, task_status_payload
+from app.utils.file_utils import file_manager
+from app.dependencies import get_synthesis_engine, get_async_synthesis_manager
+from app.api.v1._common import read_prompt_audio, handle_synthesis_errors, TaskJSONResponse
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/cross-lingual", tags=["跨语种复刻 (Cross-lingual Voice Cloning)"])
-
-
-def get_voice_manager(request: Request) -> VoiceManager:
-    """Dependency to get voice manager from app state"""
-    voice_manager = getattr(request.app.state, 'voice_manager', None)
-    if not voice_manager:
-        raise HTTPException(status_code=503, detail="Voice manager not available")
-    if not voice_manager.is_ready():
-        raise ModelNotReadyError("Voice manager is not ready")
-    return voice_manager
-
-
-def get_synthesis_engine(voice_manager: VoiceManager = Depends(get_voice_manager)) -> SynthesisEngine:
-    """Dependency to get synthesis engine"""
-    return SynthesisEngine(voice_manager)
-
-
-def get_async_synthesis_manager(request: Request) -> AsyncSynthesisManager:
-    """Dependency to get async synthesis manager from app state"""
-    async_manager = getattr(request.app.state, 'async_synthesis_manager', None)
-    if not async_manager:
-        raise HTTPException(status_code=503, detail="Async synthesis manager not available")
-    return async_manager
+# Media types for served audio files, keyed by file extension
+MEDIA_TYPE_MAP = {
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".flac": "audio/flac",
+    ".m4a": "audio/mp4",
+}
+
+router = APIRouter(
+    prefix="/cross-lingual",
+    tags=["跨语种复刻 (Cross-lingual Voice Cloning)"],
+    default_response_class=ORJSONResponse
+)
 
 
 @router.post("/with-audio", response_model=SynthesisResponse)
+@handle_synthesis_errors
 async def cross_lingual_with_audio(
-    text: str = Form(..., description="要合成的文本 (Text to synthesize)"),
-    format: AudioFormat = Form(AudioFormat.WAV, description="输出音频格式"),
-    speed: float = Form(1.0, description="语速倍数"),
-    stream: bool = Form(False, description="是否流式推理 (默认: 否)"),
-    prompt_audio: UploadFile = File(..., description="参考音频文件 (Reference audio file)"),
+    form: Annotated[CrossLingualWithAudioForm, Form()],
     synthesis_engine: SynthesisEngine = Depends(get_synthesis_engine)
 ):
     """跨语种复刻 - 带音频文件 (Cross-lingual voice cloning with audio file)
@@ -65,169 +52,182 @@ async def cross_lingual_with_audio(
     Exactly like repo gốc CosyVoice: chỉ cần text và prompt_audio.
     KHÔNG sử dụng prompt_text hay instruct_text như repo gốc.
     """
-    
-    try:
-        # Save uploaded audio to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-            content = await prompt_audio.read()
-            temp_file.write(content)
-            temp_audio_path = temp_file.name
-        
-        try:
-            # Create request object - chỉ cần text và prompt_audio như repo gốc
-            request = CrossLingualWithAudioRequest(
-                text=text,
-                prompt_text="",  # Empty như repo gốc
-                prompt_audio_url=temp_audio_path,
-                instruct_text="",  # Empty như repo gốc
-                format=format,
-                speed=speed,
-                stream=stream
-            )
-            
-            result = await synthesis_engine.synthesize_cross_lingual_with_audio(request)
-            logger.info(f"跨语种复刻合成完成 (Cross-lingual synthesis with audio completed)")
-            return result
-            
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_audio_path):
-                os.unlink(temp_audio_path)
-                
-    except VoiceNotFoundError as e:
-        logger.warning(f"Voice not found: {e}")
-        raise HTTPException(status_code=404, detail=str(e))
-    except ModelNotReadyError as e:
-        logger.error(f"Model not ready: {e}")
-        raise HTTPException(status_code=503, detail=str(e))
-    except SynthesisError as e:
-        logger.error(f"Synthesis error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        logger.error(f"Unexpected error in cross-lingual synthesis with audio: {e}")
-        raise HTTPException(status_code=500, detail=f"Cross-lingual synthesis failed: {str(e)}")
+    prompt_audio_key, prompt_features, prompt_speech_16k = await read_prompt_audio(
+        form.prompt_audio, synthesis_engine.voice_manager.embedding_cache
+    )
+
+    # Create request object - chỉ cần text và prompt_audio như repo gốc
+    request = CrossLingualWithAudioRequest(
+        text=form.text,
+        prompt_text="",  # Empty như repo gốc
+        prompt_audio_url="",  # Prompt audio is passed decoded, not by path
+        prompt_audio_key=prompt_audio_key,
+        instruct_text="",  # Empty như repo gốc
+        format=form.format,
+        speed=form.speed,
+        stream=form.stream
+    )
+
+    result = await synthesis_engine.synthesize_cross_lingual_with_audio(
+        request, prompt_features=prompt_features, prompt_speech_16k=prompt_speech_16k
+    )
+    logger.info("跨语种复刻合成完成 (Cross-lingual synthesis with audio completed)")
+    return result
 
 
 @router.post("/with-cache", response_model=SynthesisResponse)
+@handle_synthesis_errors
 async def cross_lingual_with_cache(
     request: CrossLingualWithCacheRequest,
     synthesis_engine: SynthesisEngine = Depends(get_synthesis_engine)
 ):
     """跨语种复刻 - 使用缓存语音 (Cross-lingual voice cloning with cached voice)"""
-    
+    result = await synthesis_engine.synthesize_cross_lingual_with_cache(request)
+    logger.info("跨语种复刻合成完成 (Cross-lingual synthesis with cache completed) for voice: %s", request.voice_id)
+    return result
+
+
+@router.post("/with-cache/stream")
+@handle_synthesis_errors
+async def cross_lingual_with_cache_stream(
+    request: CrossLingualWithCacheRequest,
+    synthesis_engine: SynthesisEngine = Depends(get_synthesis_engine)
+):
+    """跨语种复刻 - 流式音频 (Cross-lingual voice cloning with cached voice, streamed)
+
+    Returns a 16-bit PCM WAV that is sent chunk by chunk while it is synthesized;
+    `format` and `stream` are ignored and nothing is written to disk.
+    """
+    speech = await synthesis_engine.stream_cross_lingual_with_cache(request)
+    logger.info("Streaming cross-lingual synthesis for voice: %s", request.voice_id)
+    return StreamingResponse(speech, media_type="audio/wav")
+
+
+class AudioFileResponse(FileResponse):
+    """FileResponse sending 1 MiB chunks instead of Starlette's 64 KiB; Range requests are honoured as usual"""
+    chunk_size = 1024 * 1024
+
+
+async def _audio_file_response(file_path: str, filename: str) -> FileResponse:
+    """Build a FileResponse for a generated audio file"""
     try:
-        result = await synthesis_engine.synthesize_cross_lingual_with_cache(request)
-        logger.info(f"跨语种复刻合成完成 (Cross-lingual synthesis with cache completed) for voice: {request.voice_id}")
-        return result
-    except VoiceNotFoundError as e:
-        logger.warning(f"Voice not found: {e}")
-        raise HTTPException(status_code=404, detail=str(e))
-    except ModelNotReadyError as e:
-        logger.error(f"Model not ready: {e}")
-        raise HTTPException(status_code=503, detail=str(e))
-    except SynthesisError as e:
-        logger.error(f"Synthesis error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        stat_result = await aiofiles.os.stat(file_path)
+    except FileNotFoundError:
+        logger.error("Audio file not found: %s", file_path)
+        raise HTTPException(status_code=404, detail=f"Audio file not found: {filename}")
     except Exception as e:
-        logger.error(f"Unexpected error in cross-lingual synthesis with cache: {e}")
-        raise HTTPException(status_code=500, detail=f"Cross-lingual synthesis failed: {str(e)}")
+        logger.error("Error serving audio file %s: %s", filename, e)
+        raise HTTPException(status_code=500, detail="Error serving audio file")
+
+    # Passing stat_result lets Starlette skip its own stat before sending the file
+    media_type = MEDIA_TYPE_MAP.get(os.path.splitext(filename)[1].lower(), "application/octet-stream")
+    return AudioFileResponse(
+        path=file_path,
+        media_type=media_type,
+        filename=filename,
+        stat_result=stat_result
+    )
+
+
+@lru_cache(maxsize=1024)
+def _resolve_audio_path(filename: str) -> str:
+    """Output path of a served audio file (the stat is not cached: files come and go)"""
+    return file_manager.get_output_audio_path(filename)
 
 
 # Keep audio serving endpoint
 @router.get("/audio/{filename}")
 async def get_audio_file(filename: str):
     """Serve generated audio files"""
-    from app.utils.file_utils import file_manager
-
-    try:
-        file_path = file_manager.get_output_audio_path(filename)
-        logger.info(f"Serving audio file: {filename} -> {file_path}")
-
-        if not os.path.exists(file_path):
-            logger.error(f"Audio file not found: {file_path}")
-            raise HTTPException(status_code=404, detail=f"Audio file not found: {filename}")
-
-        return FileResponse(
-            path=file_path,
-            media_type="audio/wav",
-            filename=filename
-        )
-    except Exception as e:
-        logger.error(f"Error serving audio file {filename}: {e}")
-        raise HTTPException(status_code=500, detail="Error serving audio file")
+    file_path = _resolve_audio_path(filename)
+    logger.info("Serving audio file: %s -> %s", filename, file_path)
+    return await _audio_file_response(file_path, filename)
 
 
 # Async synthesis endpoints
 @router.post("/async", response_model=AsyncTaskResponse)
+@handle_synthesis_errors
 async def create_async_synthesis_task(
     request: CrossLingualAsyncRequest,
     async_manager: AsyncSynthesisManager = Depends(get_async_synthesis_manager)
 ):
     """创建异步跨语种复刻任务 (Create async cross-lingual synthesis task)"""
-
-    try:
-        result = await async_manager.create_task(request)
-        logger.info(f"Created async synthesis task: {result.task_id}")
-        return result
-    except Exception as e:
-        logger.error(f"Failed to create async task: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to create async task: {str(e)}")
+    result = await async_manager.create_task(request)
+    logger.info("Created async synthesis task: %s", result.task_id)
+    return result
 
 
 @router.get("/async/{task_id}", response_model=AsyncTaskStatusResponse)
+@handle_synthesis_errors
 async def get_async_task_status(
     task_id: str,
+    http_request: Request,
     async_manager: AsyncSynthesisManager = Depends(get_async_synthesis_manager)
 ):
-    """查询异步任务状态 (Get async task status)"""
+    """查询异步任务状态 (Get async task status)
 
-    try:
-        result = await async_manager.get_task_status(task_id)
-        return result
-    except Exception as e:
-        logger.error(f"Failed to get task status for {task_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to get task status: {str(e)}")
+    Clients sending `Accept: audio/*` get the audio of a completed task directly.
+    """
+    task = await async_manager.get_task_status(task_id)
+    if not task:
+        return TaskJSONResponse({
+            "success": False,
+            "task_id": task_id,
+            "status": "not_found",
+            "progress": 0.0,
+            "message": "Task not found"
+        })
+    if (task.status == TaskStatus.COMPLETED and task.file_path
+            and "audio/" in http_request.headers.get("accept", "")):
+        return await _audio_file_response(task.file_path, os.path.basename(task.file_path))
+    return TaskJSONResponse(task)
+
+
+@router.get("/async/{task_id}/events")
+@handle_synthesis_errors
+async def stream_async_task_events(
+    task_id: str,
+    async_manager: AsyncSynthesisManager = Depends(get_async_synthesis_manager)
+):
+    """订阅异步任务状态 (Stream async task status as server-sent events)
+
+    Sends the task status now and on every change; the stream ends once the task is completed or failed.
+    """
+    if task_id not in async_manager.tasks:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def events():
+        async for task in async_manager.watch_task(task_id):
+            yield b"data: " + orjson.dumps(task_status_payload(task)) + b"\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.get("/async", response_model=dict)
+@handle_synthesis_errors
 async def list_async_tasks(
     async_manager: AsyncSynthesisManager = Depends(get_async_synthesis_manager)
 ):
     """列出所有异步任务 (List all async tasks)"""
-
-    try:
-        tasks = await async_manager.list_tasks()
-        return {
-            "success": True,
-            "total": len(tasks),
-            "tasks": tasks
-        }
-    except Exception as e:
-        logger.error(f"Failed to list tasks: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to list tasks: {str(e)}")
+    tasks = await async_manager.list_tasks()
+    return TaskJSONResponse({
+        "success": True,
+        "total": len(tasks),
+        "tasks": tasks
+    })
 
 
 @router.delete("/async/{task_id}")
+@handle_synthesis_errors
 async def cancel_async_task(
     task_id: str,
     async_manager: AsyncSynthesisManager = Depends(get_async_synthesis_manager)
 ):
     """取消异步任务 (Cancel async task)"""
-
-    try:
-        # Mark task as cancelled (can't really cancel running tasks)
-        async with async_manager._lock:
-            if task_id in async_manager.tasks:
-                task = async_manager.tasks[task_id]
-                if task.status == TaskStatus.PENDING:
-                    task.status = TaskStatus.FAILED
-                    task.error_message = "Task cancelled by user"
-                    task.completed_at = datetime.now().isoformat()
-                return {"success": True, "message": f"Task {task_id} cancelled"}
-            else:
-                raise HTTPException(status_code=404, detail="Task not found")
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Failed to cancel task {task_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to cancel task: {str(e)}")
+    if await async_manager.cancel_task(task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return {"success": True, "message": f"Task {task_id} cancelled"}
@@ -2,27 +2,37 @@
 Task-based synthesis API endpoints
 """
 
-import asyncio
 import hashlib
+import asyncio
+import heapq
 import os
+import struct
 import time
 import uuid
-from datetime import datetime
-from typing import Dict, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Union
 
+import aiofiles.os
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 
 from app.models.synthesis import CrossLingualWithCacheRequest
+from app.core.config import settings
 from app.core.synthesis_engine import SynthesisEngine
+from app.core.task_store import MemoryTaskStore, RedisTaskStore, create_task_store
 from app.core.voice_manager import VoiceManager
 from app.dependencies import get_synthesis_engine
+from app.utils.file_utils import file_manager, AUDIO_URL_TMPL
+
+router = APIRouter(default_response_class=ORJSONResponse)
 
-router = APIRouter()
+# Task state: in-process by default, Redis when a task broker is configured
+task_store = create_task_store(settings.TASK_BROKER_URL, settings.TASK_TTL, settings.TASK_STORE_MAX_SIZE)
 
-# Global task storage
-tasks_storage: Dict[str, Dict] = {}
-tasks_lock = asyncio.Lock()
+# In-process single flight: content hash -> future resolved with the outcome of the task synthesizing it
+_inflight: Dict[str, asyncio.Future] = {}
 
 class TaskRequest(BaseModel):
     """Task-based synthesis request"""
@@ -53,24 +63,48 @@ class TaskStatusResponse(BaseModel):
     completed_at: Optional[str] = Field(None, description="Task completion timestamp")
     error_message: Optional[str] = Field(None, description="Error message if failed")
 
-def generate_file_path(text: str, voice_id: str, format: str) -> tuple[str, str]:
-    """Generate pre-allocated file path and URL"""
-    # Create deterministic hash for caching
-    content_hash = hashlib.md5(f"{text}_{voice_id}_{format}".encode()).hexdigest()[:8]
+def _iso(ns: Optional[int]) -> Optional[str]:
+    """Render a time.time_ns() timestamp as an ISO 8601 UTC string"""
+    if ns is None:
+        return None
+    return datetime.fromtimestamp(ns / 1e9, tz=timezone.utc).isoformat()
+
+def generate_file_path(text: str, voice_id: str, voice_created_at: datetime, format: str,
+                       speed: float) -> tuple[str, str, str]:
+    """
+    Generate content hash, pre-allocated file path and URL
+    The voice's creation time is hashed too, so a voice re-enrolled under the same id with other
+    audio never matches results synthesized with the old one
+    """
+    # Create deterministic hash for caching - NUL-separated fields, so no delimiter collisions
+    hasher = hashlib.blake2b(digest_size=8)
+    hasher.update(text.encode())
+    hasher.update(b"\0")
+    hasher.update(voice_id.encode())
+    hasher.update(b"\0")
+    hasher.update(struct.pack("<d", voice_created_at.timestamp()))
+    hasher.update(format.encode())
+    hasher.update(b"\0")
+    hasher.update(struct.pack("<d", speed))
+    content_hash = hasher.hexdigest()
     filename = f"task_{content_hash}.{format}"
-    file_path = os.path.join("outputs", filename)
-    audio_url = f"/api/v1/audio/{filename}"
-    return file_path, audio_url
+    file_path = file_manager.get_output_audio_path(filename)
+    audio_url = AUDIO_URL_TMPL(filename)
+    return content_hash, file_path, audio_url
 
-async def process_task_background(task_id: str, request: TaskRequest, synthesis_engine: SynthesisEngine):
-    """Background task processing"""
+async def process_task_background(task_id: str, request: TaskRequest, synthesis_engine: SynthesisEngine,
+                                  store: Optional[Union[MemoryTaskStore, RedisTaskStore]] = None
+                                  ) -> Optional[Dict[str, Any]]:
+    """
+    Background task processing - runs in the API process or on a Celery GPU worker
+    store defaults to this module's task_store, looked up when called
+    Returns the final fields written to the task, or None if the task does not exist
+    """
+    store = store or task_store
     try:
-        async with tasks_lock:
-            if task_id not in tasks_storage:
-                return
-            tasks_storage[task_id]["status"] = "processing"
-            tasks_storage[task_id]["progress"] = 0.1
-
+        task_data = await store.get(task_id)
+        if task_data is None:
+            return None
         # Create synthesis request
         synthesis_request = CrossLingualWithCacheRequest(
             text=request.text,
@@ -80,47 +114,61 @@ async def process_task_background(task_id: str, request: TaskRequest, synthesis_
             stream=False
         )
 
-        # Update progress
-        async with tasks_lock:
-            if task_id in tasks_storage:
-                tasks_storage[task_id]["progress"] = 0.3
+        await store.update(task_id, {"status": "processing", "progress": 0.3})
 
         # Perform synthesis
-        start_time = time.time()
+        start_time = time.perf_counter()
         result = await synthesis_engine.synthesize_cross_lingual_with_cache(synthesis_request)
-        end_time = time.time()
-
-        # Move file to pre-allocated path
-        if result.file_path and os.path.exists(result.file_path):
-            target_path = tasks_storage[task_id]["file_path"]
-            os.makedirs(os.path.dirname(target_path), exist_ok=True)
-            
-            # Move file to pre-allocated location
-            if os.path.exists(target_path):
-                os.remove(target_path)  # Remove if exists
-            os.rename(result.file_path, target_path)
+        end_time = time.perf_counter()
+
+        # Move file to pre-allocated path - atomic rename-over, both live in OUTPUT_DIR
+        if result.file_path:
+            os.replace(result.file_path, task_data["file_path"])
 
         # Update task completion
-        async with tasks_lock:
-            if task_id in tasks_storage:
-                tasks_storage[task_id].update({
-                    "status": "completed",
-                    "progress": 1.0,
-                    "duration": result.duration,
-                    "synthesis_time": end_time - start_time,
-                    "completed_at": datetime.now().isoformat()
-                })
+        await store.add_completed(task_data["content_hash"], result.duration)
+        outcome = {
+            "status": "completed",
+            "progress": 1.0,
+            "duration": result.duration,
+            "synthesis_time": end_time - start_time,
+            "completed_at_ns": time.time_ns()
+        }
 
     except Exception as e:
         # Update task failure
-        async with tasks_lock:
-            if task_id in tasks_storage:
-                tasks_storage[task_id].update({
-                    "status": "failed",
-                    "progress": 0.0,
-                    "error_message": str(e),
-                    "completed_at": datetime.now().isoformat()
-                })
+        outcome = {
+            "status": "failed",
+            "progress": 0.0,
+            "error_message": str(e),
+            "completed_at_ns": time.time_ns()
+        }
+
+    await store.update(task_id, outcome)
+    return outcome
+
+async def _process_single_flight(task_id: str, request: TaskRequest, synthesis_engine: SynthesisEngine,
+                                 content_hash: str):
+    """Synthesize a task and hand its outcome to identical tasks submitted meanwhile"""
+    outcome = None
+    try:
+        outcome = await process_task_background(task_id, request, synthesis_engine)
+    finally:
+        _inflight.pop(content_hash).set_result(outcome)
+
+async def _follow_inflight(task_id: str, inflight: asyncio.Future):
+    """Complete a task with the outcome of an identical task already being synthesized"""
+    await task_store.update(task_id, {"status": "processing", "progress": 0.3})
+    # Shielded so that cancelling this follower does not cancel the shared future
+    outcome = await asyncio.shield(inflight)
+    if outcome is None:
+        outcome = {
+            "status": "failed",
+            "progress": 0.0,
+            "error_message": "Identical task was removed before it completed",
+            "completed_at_ns": time.time_ns()
+        }
+    await task_store.update(task_id, outcome)
 
 @router.post("/cross-lingual/task", response_model=TaskResponse)
 async def create_synthesis_task(
@@ -135,33 +183,89 @@ async def create_synthesis_task(
     then processes the synthesis in the background.
     """
     
+    voice = await synthesis_engine.voice_manager.get_voice(request.voice_id)
+    if voice is None:
+        raise HTTPException(status_code=404, detail=f"Voice '{request.voice_id}' not found")
+
     # Generate unique task ID
     task_id = str(uuid.uuid4())
     
     # Pre-allocate file path
-    file_path, audio_url = generate_file_path(request.text, request.voice_id, request.format)
+    content_hash, file_path, audio_url = generate_file_path(
+        request.text, request.voice_id, voice.created_at, request.format, request.speed
+    )
+    
+    request_data = request.model_dump()
     
     # Estimate duration (rough estimate based on text length)
     estimated_duration = len(request.text) * 0.15  # ~0.15s per character
     
+    # Identical input already synthesized: register the task as completed without re-running it,
+    # unless its file was removed meanwhile - then forget the result and synthesize again
+    completed = await task_store.get_completed(content_hash)
+    if completed is not None and not await aiofiles.os.path.exists(file_path):
+        await task_store.discard_completed(content_hash)
+        completed = None
+    if completed is not None:
+        created_at_ns = time.time_ns()
+        await task_store.create(task_id, {
+            "task_id": task_id,
+            "status": "completed",
+            "file_path": file_path,
+            "audio_url": audio_url,
+            "content_hash": content_hash,
+            "progress": 1.0,
+            "duration": completed["duration"],
+            "synthesis_time": 0.0,
+            "request": request_data,
+            "created_at_ns": created_at_ns,
+            "completed_at_ns": created_at_ns,
+            "estimated_duration": 0.0
+        })
+        return TaskResponse(
+            task_id=task_id,
+            status="completed",
+            file_path=file_path,
+            audio_url=audio_url,
+            estimated_duration=0.0,
+            created_at=_iso(created_at_ns)
+        )
+    
     # Register task
     task_data = {
         "task_id": task_id,
         "status": "registered",
         "file_path": file_path,
         "audio_url": audio_url,
+        "content_hash": content_hash,
         "progress": 0.0,
-        "request": request.dict(),
-        "created_at": datetime.now().isoformat(),
+        "request": request_data,
+        "created_at_ns": time.time_ns(),
         "estimated_duration": estimated_duration
     }
     
-    async with tasks_lock:
-        tasks_storage[task_id] = task_data
+    await task_store.create(task_id, task_data)
     
     # Start background processing
-    if synthesis_engine:
-        background_tasks.add_task(process_task_background, task_id, request, synthesis_engine)
+    if settings.TASK_BROKER_URL:
+        # Hand off to a GPU worker; publishing is a blocking broker round-trip, so keep it off the loop
+        from kombu.exceptions import OperationalError
+        from app.core.task_queue import synthesize_task, TASK_QUEUE
+        try:
+            await run_in_threadpool(
+                synthesize_task.apply_async, args=[task_id, request_data], task_id=task_id, queue=TASK_QUEUE
+            )
+        except OperationalError as e:
+            await task_store.delete(task_id)
+            raise HTTPException(status_code=503, detail="Task broker unavailable") from e
+    elif synthesis_engine:
+        # Identical input already being synthesized: wait for that run instead of starting another
+        inflight = _inflight.get(content_hash)
+        if inflight is None:
+            _inflight[content_hash] = asyncio.get_running_loop().create_future()
+            background_tasks.add_task(_process_single_flight, task_id, request, synthesis_engine, content_hash)
+        else:
+            background_tasks.add_task(_follow_inflight, task_id, inflight)
     
     return TaskResponse(
         task_id=task_id,
@@ -169,18 +273,16 @@ async def create_synthesis_task(
         file_path=file_path,
         audio_url=audio_url,
         estimated_duration=estimated_duration,
-        created_at=task_data["created_at"]
+        created_at=_iso(task_data["created_at_ns"])
     )
 
 @router.get("/cross-lingual/task/{task_id}", response_model=TaskStatusResponse)
 async def get_task_status(task_id: str):
     """Get task status and progress"""
     
-    async with tasks_lock:
-        if task_id not in tasks_storage:
-            raise HTTPException(status_code=404, detail="Task not found")
-        
-        task_data = tasks_storage[task_id]
+    task_data = await task_store.get(task_id)
+    if task_data is None:
+        raise HTTPException(status_code=404, detail="Task not found")
     
     return TaskStatusResponse(
         task_id=task_id,
@@ -190,8 +292,8 @@ async def get_task_status(task_id: str):
         progress=task_data["progress"],
         duration=task_data.get("duration"),
         synthesis_time=task_data.get("synthesis_time"),
-        created_at=task_data["created_at"],
-        completed_at=task_data.get("completed_at"),
+        created_at=_iso(task_data["created_at_ns"]),
+        completed_at=_iso(task_data.get("completed_at_ns")),
         error_message=task_data.get("error_message")
     )
 
@@ -199,21 +301,23 @@ async def get_task_status(task_id: str):
 async def list_tasks(limit: int = 50, status: Optional[str] = None):
     """List all tasks with optional status filter"""
     
-    async with tasks_lock:
-        all_tasks = list(tasks_storage.values())
+    all_tasks = await task_store.list()
     
     # Filter by status if provided
     if status:
         all_tasks = [task for task in all_tasks if task["status"] == status]
     
-    # Sort by creation time (newest first)
-    all_tasks.sort(key=lambda x: x["created_at"], reverse=True)
+    # Newest first, limited - partial sort on the integer creation time
+    all_tasks = heapq.nlargest(limit, all_tasks, key=lambda x: x["created_at_ns"])
     
-    # Limit results
-    all_tasks = all_tasks[:limit]
+    # Timestamps are stored as integers and only rendered for the tasks returned
+    tasks = [
+        {**task, "created_at": _iso(task["created_at_ns"]), "completed_at": _iso(task.get("completed_at_ns"))}
+        for task in all_tasks
+    ]
     
     return {
-        "tasks": all_tasks,
+        "tasks": tasks,
         "total": len(all_tasks),
         "status_filter": status
     }
@@ -222,18 +326,16 @@ async def list_tasks(limit: int = 50, status: Optional[str] = None):
 async def delete_task(task_id: str):
     """Delete a task and its associated file"""
     
-    async with tasks_lock:
-        if task_id not in tasks_storage:
-            raise HTTPException(status_code=404, detail="Task not found")
-        
-        task_data = tasks_storage[task_id]
-        
-        # Remove file if exists
-        file_path = task_data["file_path"]
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # Remove from storage
-        del tasks_storage[task_id]
+    task_data = await task_store.delete(task_id)
+    if task_data is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    # Identical tasks share one result file: remove it only once no other task points at it
+    if not await task_store.content_refs(task_data["content_hash"]):
+        try:
+            await aiofiles.os.remove(task_data["file_path"])
+        except FileNotFoundError:
+            pass
+        await task_store.discard_completed(task_data["content_hash"])
     
     return {"message": f"Task {task_id} deleted successfully"}
@@ -3,66 +3,121 @@ Voice management API endpoints
 """
 
 import logging
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request
-from fastapi.responses import JSONResponse
+from typing import List, Optional, Tuple
+
+import aiofiles
+from fastapi import (
+    APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+)
+from fastapi.responses import JSONResponse, ORJSONResponse
 
 from app.models.voice import (
     VoiceCreate, VoiceUpdate, VoiceResponse, VoiceListResponse, 
     VoiceStats, VoiceType, AudioFormat
 )
-from app.core.voice_manager import VoiceManager
+from app.core.config import settings
+from app.core.synthesis_engine import SynthesisEngine
+from app.core.voice_manager import VoiceManager, audio_hasher, voices_etag
+from app.dependencies import get_synthesis_engine, get_voice_manager
 from app.core.exceptions import (
     VoiceNotFoundError, VoiceAlreadyExistsError, 
-    AudioProcessingError, ModelNotReadyError
+    AudioProcessingError
 )
+from app.utils.audio import AUDIO_MAGIC_SIZE, detect_audio_format
+from app.utils.file_utils import file_manager, UPLOAD_CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/voices", tags=["Voice Management"])
 
+# VoiceInDB attributes exposed in a VoiceResponse (model_data and file paths stay internal)
+_VOICE_RESPONSE_FIELDS = tuple(VoiceResponse.model_fields)
+
+
+def _voice_payload(voice) -> dict:
+    """
+    VoiceResponse fields of a trusted VoiceInDB, without re-validating or dumping model_data
+    Endpoints return it in an ORJSONResponse so FastAPI does not validate it against response_model again
+    """
+    return {field: getattr(voice, field) for field in _VOICE_RESPONSE_FIELDS}
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already matches etag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
 
-def get_voice_manager(request: Request) -> VoiceManager:
-    """Dependency to get voice manager from app state"""
-    voice_manager = getattr(request.app.state, 'voice_manager', None)
-    if not voice_manager:
-        raise HTTPException(status_code=503, detail="Voice manager not available")
-    if not voice_manager.is_ready():
-        raise ModelNotReadyError("Voice manager is not ready")
-    return voice_manager
+
+async def _spool_audio_upload(audio_file: UploadFile, voice_id: str,
+                              declared_format: AudioFormat) -> Tuple[str, str]:
+    """
+    Stream an uploaded audio file to a temp file in chunks, so memory use does not grow with its size
+    The format is taken from the file's magic bytes rather than its name: content that is not a
+    known audio container, or not the declared audio_format, is rejected with a 415 before anything
+    is written, uploads over MAX_FILE_SIZE get a 413
+    Returns: (temp file path, audio_hasher digest of the content)
+    """
+    head = await audio_file.read(AUDIO_MAGIC_SIZE)
+    if not head:
+        raise HTTPException(status_code=400, detail="Empty audio file")
+    
+    file_ext = detect_audio_format(head)
+    if file_ext is None:
+        raise HTTPException(status_code=415, detail="Unsupported audio format: expected WAV, FLAC, MP3 or M4A content")
+    if file_ext != declared_format.value:
+        # The declared format decides whether the audio is copied or converted when stored
+        raise HTTPException(
+            status_code=415,
+            detail=f"Audio content is {file_ext.upper()} but audio_format is '{declared_format.value}'"
+        )
+    
+    temp_file = file_manager.get_temp_file_path(f"{voice_id}.{file_ext}")
+    size = len(head)
+    hasher = audio_hasher()
+    hasher.update(head)
+    try:
+        async with aiofiles.open(temp_file, 'wb') as f:
+            await f.write(head)
+            while chunk := await audio_file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Audio file exceeds maximum allowed size ({settings.MAX_FILE_SIZE} bytes)"
+                    )
+                hasher.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        file_manager.delete_file(temp_file)
+        raise
+    return temp_file, hasher.hexdigest()
 
 
 @router.post("/", response_model=VoiceResponse, status_code=201)
 async def create_voice(
+    background_tasks: BackgroundTasks,
     voice_id: str = Form(..., description="Unique voice identifier"),
     name: str = Form(..., description="Human-readable voice name"),
     description: Optional[str] = Form(None, description="Voice description"),
     voice_type: VoiceType = Form(..., description="Type of voice"),
     language: Optional[str] = Form(None, description="Primary language of the voice"),
     prompt_text: Optional[str] = Form(None, description="Text that matches the audio sample"),
-    audio_format: AudioFormat = Form(AudioFormat.WAV, description="Audio file format"),
+    audio_format: AudioFormat = Form(AudioFormat.WAV, description="Audio file format; must match the uploaded content"),
     audio_file: UploadFile = File(..., description="Audio file for voice cloning"),
-    voice_manager: VoiceManager = Depends(get_voice_manager)
+    voice_manager: VoiceManager = Depends(get_voice_manager),
+    synthesis_engine: SynthesisEngine = Depends(get_synthesis_engine)
 ):
     """Create a new voice in the cache"""
     
     try:
-        # Validate file format
         if not audio_file.filename:
             raise HTTPException(status_code=400, detail="No audio file provided")
         
-        file_ext = audio_file.filename.split('.')[-1].lower()
-        if file_ext not in ['wav', 'mp3', 'flac', 'm4a']:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Unsupported audio format: {file_ext}"
-            )
-        
-        # Read file content
-        audio_content = await audio_file.read()
-        if len(audio_content) == 0:
+        if audio_file.size == 0:
             raise HTTPException(status_code=400, detail="Empty audio file")
-        
+
         # Create voice object
         voice_create = VoiceCreate(
             voice_id=voice_id,
@@ -74,12 +129,18 @@ async def create_voice(
             audio_format=audio_format
         )
         
-        # Add voice to manager
-        voice = await voice_manager.add_voice(voice_create, audio_content)
+        # Stream the upload to disk and add the voice from there
+        temp_file, audio_hash = await _spool_audio_upload(audio_file, voice_id, audio_format)
+        voice = await voice_manager.add_voice_from_path(voice_create, temp_file, audio_hash)
         
         logger.info(f"Created voice: {voice_id}")
-        return VoiceResponse(**voice.dict())
+        # Extract its prompt features after responding, so the first synthesis request finds them cached
+        if settings.PRELOAD_VOICE_FEATURES:
+            background_tasks.add_task(synthesis_engine.preload_cached_voices, [voice_id])
+        return ORJSONResponse(_voice_payload(voice), status_code=201)
         
+    except HTTPException:
+        raise
     except VoiceAlreadyExistsError as e:
         raise HTTPException(status_code=409, detail=str(e))
     except AudioProcessingError as e:
@@ -93,6 +154,7 @@ async def create_voice(
 
 @router.get("/", response_model=VoiceListResponse)
 async def list_voices(
+    request: Request,
     voice_type: Optional[VoiceType] = Query(None, description="Filter by voice type"),
     language: Optional[str] = Query(None, description="Filter by language"),
     page: int = Query(1, ge=1, description="Page number"),
@@ -109,12 +171,19 @@ async def list_voices(
             page_size=page_size
         )
         
-        return VoiceListResponse(
-            voices=[VoiceResponse(**voice.dict()) for voice in voices],
-            total=total,
-            page=page,
-            page_size=page_size
-        )
+        # Pollers that already hold this page get a 304 without it being serialized again
+        etag = voices_etag(voices, total)
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        # Voices come from our own cache: serialize them straight with orjson instead of
+        # building and re-validating a VoiceResponse per voice
+        return ORJSONResponse({
+            "voices": [_voice_payload(voice) for voice in voices],
+            "total": total,
+            "page": page,
+            "per_page": page_size
+        }, headers={"ETag": etag})
         
     except Exception as e:
         logger.error(f"Error listing voices: {e}")
@@ -124,16 +193,20 @@ async def list_voices(
 @router.get("/{voice_id}", response_model=VoiceResponse)
 async def get_voice(
     voice_id: str,
+    request: Request,
     voice_manager: VoiceManager = Depends(get_voice_manager)
 ):
     """Get a specific voice by ID"""
     
     try:
-        voice = await voice_manager.get_voice(voice_id)
-        if not voice:
+        etag = await voice_manager.get_voice_etag(voice_id)
+        if etag is None:
             raise VoiceNotFoundError(f"Voice with ID '{voice_id}' not found")
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
         
-        return VoiceResponse(**voice.dict())
+        voice = await voice_manager.get_voice(voice_id)
+        return ORJSONResponse(_voice_payload(voice), headers={"ETag": etag})
         
     except VoiceNotFoundError:
         raise HTTPException(status_code=404, detail=f"Voice '{voice_id}' not found")
@@ -156,7 +229,7 @@ async def update_voice(
             raise VoiceNotFoundError(f"Voice with ID '{voice_id}' not found")
         
         logger.info(f"Updated voice: {voice_id}")
-        return VoiceResponse(**voice.dict())
+        return ORJSONResponse(_voice_payload(voice))
         
     except VoiceNotFoundError:
         raise HTTPException(status_code=404, detail=f"Voice '{voice_id}' not found")
@@ -5,16 +5,37 @@ Async Synthesis Manager for handling concurrent synthesis tasks
 import asyncio
 import logging
 import time
-import uuid
+import secrets
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Optional, Set
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
 from enum import Enum
 
+import aiohttp
+import attrs
+import orjson
+
 from app.core.synthesis_engine import SynthesisEngine
-from app.models.synthesis import CrossLingualAsyncRequest, AsyncTaskResponse, AsyncTaskStatusResponse
+from app.core.exceptions import QueueFullError
+from app.models.synthesis import (
+    CrossLingualAsyncRequest, CrossLingualWithCacheRequest, AsyncTaskResponse
+)
 
 logger = logging.getLogger(__name__)
 
+# Webhook delivery: per-attempt timeout (seconds), attempts, and initial retry backoff (seconds)
+CALLBACK_TIMEOUT = 10
+CALLBACK_ATTEMPTS = 3
+CALLBACK_BACKOFF = 0.5
+
+# Seconds a task watcher waits for a state change before the unchanged status is sent again
+WATCH_HEARTBEAT = 30
+
+
+def generate_task_id() -> str:
+    """Random 48-bit task id, without building and formatting a full UUID"""
+    return "task_" + secrets.token_hex(6)
+
 
 class TaskStatus(str, Enum):
     PENDING = "pending"
@@ -23,71 +44,125 @@ class TaskStatus(str, Enum):
     FAILED = "failed"
 
 
+@attrs.define(slots=True)
 class AsyncTask:
     """Async synthesis task"""
-    
-    def __init__(self, task_id: str, request: CrossLingualAsyncRequest):
-        self.task_id = task_id
-        self.request = request
-        self.status = TaskStatus.PENDING
-        self.progress = 0.0
-        self.message = "Task created"
-        self.audio_url: Optional[str] = None
-        self.file_path: Optional[str] = None
-        self.duration: Optional[float] = None
-        self.synthesis_time: Optional[float] = None
-        self.error_message: Optional[str] = None
-        self.created_at = datetime.now().isoformat()
-        self.completed_at: Optional[str] = None
+    task_id: str
+    request: CrossLingualAsyncRequest
+    status: TaskStatus = TaskStatus.PENDING
+    progress: float = 0.0
+    message: str = "Task created"
+    audio_url: Optional[str] = None
+    file_path: Optional[str] = None
+    duration: Optional[float] = None
+    synthesis_time: Optional[float] = None
+    error_message: Optional[str] = None
+    # Kept as datetimes; orjson renders them as ISO 8601 when the status is sent
+    created_at: datetime = attrs.field(factory=datetime.now)
+    completed_at: Optional[datetime] = None
+    # Monotonic creation time for age checks, immune to wall-clock changes
+    created_monotonic: float = attrs.field(factory=time.monotonic)
+    # Status payload, built once the task is finished and can no longer change
+    _status_payload: Optional[Dict[str, Any]] = attrs.field(default=None, init=False)
+    # Set on the next state change, then replaced; only created while someone watches the task
+    _changed: Optional[asyncio.Event] = attrs.field(default=None, init=False)
+
+
+# Task fields reported to clients - the request payload, monotonic clock and payload cache stay internal
+_STATUS_FILTER = attrs.filters.exclude(
+    attrs.fields(AsyncTask).request,
+    attrs.fields(AsyncTask).created_monotonic,
+    attrs.fields(AsyncTask)._status_payload,
+    attrs.fields(AsyncTask)._changed,
+)
+
+
+def task_status_payload(task: AsyncTask) -> Dict[str, Any]:
+    """Task status in the AsyncTaskStatusResponse shape; cached once the task is finished"""
+    if task._status_payload is not None:
+        return task._status_payload
+    payload = attrs.asdict(task, recurse=False, filter=_STATUS_FILTER)
+    payload["success"] = True
+    if task.status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+        task._status_payload = payload
+    return payload
 
 
 class AsyncSynthesisManager:
     """Manager for handling async synthesis tasks"""
 
-    def __init__(self, synthesis_engine: SynthesisEngine, max_concurrent: int = 4):
+    def __init__(self, synthesis_engine: SynthesisEngine, max_concurrent: int = 4,
+                 max_batch_size: int = 8, batch_window: float = 0.005, max_tasks: int = 10000,
+                 max_queue_size: int = 1000):
         self.synthesis_engine = synthesis_engine
-        self.max_concurrent = max_concurrent  # Keep for reference but don't enforce
-        self.tasks: Dict[str, AsyncTask] = {}
-        # NO LIMITS - Full parallel processing!
-        self._task_lock = asyncio.Lock()  # Keep for task dict protection only
+        self.max_concurrent = max_concurrent
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        # Task ids waiting to be batched; bounded so a backlog is rejected instead of growing without limit
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        # Formed batches waiting for a worker; holding at most one lets the backlog coalesce while workers are busy
+        self._batches: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._workers: List[asyncio.Task] = []
+        # Shared webhook session (created on first callback) and in-flight callback deliveries
+        self._http = None
+        self._callbacks: Set[asyncio.Task] = set()
+        # LRU order: oldest / least recently polled first, bounded by max_tasks
+        self.max_tasks = max_tasks
+        self.tasks: "OrderedDict[str, AsyncTask]" = OrderedDict()
         self.running_tasks: Set[str] = set()
         self.running = False
-        self._lock = asyncio.Lock()
-        # REMOVED: self._semaphore - No concurrent limits!
-        
+        # self.tasks needs no lock: the event loop is single-threaded and no access awaits mid-update
+
     async def start(self):
         """Start the async synthesis manager"""
         self.running = True
-        logger.info(f"Async synthesis manager started with {self.max_concurrent} concurrent tasks")
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)]
+        logger.info("Async synthesis manager started with %d workers", self.max_concurrent)
 
     async def stop(self):
         """Stop the async synthesis manager"""
         self.running = False
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        for callback in list(self._callbacks):
+            callback.cancel()
+        if self._http:
+            await self._http.close()
+            self._http = None
         # Cancel all running tasks
         for task_id in list(self.running_tasks):
-            async with self._lock:
-                if task_id in self.tasks:
-                    task = self.tasks[task_id]
-                    if task.status == TaskStatus.PROCESSING:
-                        task.status = TaskStatus.FAILED
-                        task.error_message = "Server shutdown"
+            if task_id in self.tasks:
+                task = self.tasks[task_id]
+                if task.status == TaskStatus.PROCESSING:
+                    task.status = TaskStatus.FAILED
+                    task.error_message = "Server shutdown"
+                    self._notify(task)
         logger.info("Async synthesis manager stopped")
         
     async def create_task(self, request: CrossLingualAsyncRequest) -> AsyncTaskResponse:
         """Create a new async synthesis task"""
-        task_id = f"task_{uuid.uuid4().hex[:12]}"
+        if self._queue.full():
+            raise QueueFullError("Too many queued synthesis tasks, retry later")
 
-        async with self._lock:
-            task = AsyncTask(task_id, request)
-            self.tasks[task_id] = task
+        task_id = generate_task_id()
 
-        # Create async task (non-blocking)
-        asyncio.create_task(self._process_task_async(task_id))
+        task = AsyncTask(task_id, request)
+        self.tasks[task_id] = task
+        self._evict_tasks()
+
+        # Queue for the batching dispatcher (non-blocking, room was checked above)
+        self._queue.put_nowait(task_id)
 
         # Estimate completion time based on text length
         estimated_time = max(5.0, len(request.text) * 0.1)  # Rough estimate
 
-        logger.info(f"Created async task {task_id} for text: {request.text[:50]}...")
+        logger.info("Created async task %s for text: %.50s...", task_id, request.text)
 
         return AsyncTaskResponse(
             success=True,
@@ -97,161 +172,213 @@ class AsyncSynthesisManager:
             estimated_time=estimated_time
         )
         
-    async def get_task_status(self, task_id: str) -> AsyncTaskStatusResponse:
-        """Get status of an async task"""
-        async with self._lock:
-            task = self.tasks.get(task_id)
-
-        if not task:
-            return AsyncTaskStatusResponse(
-                success=False,
-                task_id=task_id,
-                status="not_found",
-                progress=0.0,
-                message="Task not found"
-            )
+    async def get_task_status(self, task_id: str) -> Optional[AsyncTask]:
+        """Get an async task, or None if it does not exist"""
+        task = self.tasks.get(task_id)
+        if task is not None:
+            self.tasks.move_to_end(task_id)
+        return task
+
+    async def cancel_task(self, task_id: str) -> Optional[AsyncTask]:
+        """Cancel a task that has not started yet (running tasks cannot be interrupted); None if it does not exist"""
+        task = self.tasks.get(task_id)
+        if task is not None and task.status == TaskStatus.PENDING:
+            task.status = TaskStatus.FAILED
+            task.error_message = "Task cancelled by user"
+            task.completed_at = datetime.now()
+            self._notify(task)
+        return task
+
+    async def watch_task(self, task_id: str, heartbeat: float = WATCH_HEARTBEAT) -> AsyncIterator[AsyncTask]:
+        """
+        Yield a task now and again on every state change until it is finished
+        Without a change for heartbeat seconds the task is yielded again unchanged
+        """
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+        while True:
+            yield task
+            if task.status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+                return
+            if task._changed is None:
+                task._changed = asyncio.Event()
+            try:
+                await asyncio.wait_for(task._changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _notify(task: AsyncTask):
+        """Wake the watchers of a task after a state change"""
+        if task._changed is not None:
+            task._changed.set()
+            task._changed = None
+
+    def _evict_tasks(self):
+        """Evict least recently used finished tasks beyond max_tasks; queued and running tasks are kept"""
+        # Each task is looked at most once, so a full table of active tasks cannot spin
+        for _ in range(len(self.tasks)):
+            if len(self.tasks) <= self.max_tasks:
+                return
+            task_id, task = self.tasks.popitem(last=False)
+            if task.status in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+                self.tasks[task_id] = task
 
-        return AsyncTaskStatusResponse(
-            success=True,
-            task_id=task_id,
-            status=task.status,
-            progress=task.progress,
-            message=task.message,
-            audio_url=task.audio_url,
-            file_path=task.file_path,
-            duration=task.duration,
-            synthesis_time=task.synthesis_time,
-            error_message=task.error_message,
-            created_at=task.created_at,
-            completed_at=task.completed_at
-        )
-        
-    async def list_tasks(self) -> Dict[str, AsyncTaskStatusResponse]:
+    async def list_tasks(self) -> Dict[str, AsyncTask]:
         """List all tasks"""
-        async with self._lock:
-            result = {}
-            for task_id, task in self.tasks.items():
-                result[task_id] = AsyncTaskStatusResponse(
-                    success=True,
-                    task_id=task_id,
-                    status=task.status,
-                    progress=task.progress,
-                    message=task.message,
-                    audio_url=task.audio_url,
-                    file_path=task.file_path,
-                    duration=task.duration,
-                    synthesis_time=task.synthesis_time,
-                    error_message=task.error_message,
-                    created_at=task.created_at,
-                    completed_at=task.completed_at
-                )
-            return result
-            
+        return dict(self.tasks)
+
     async def cleanup_completed_tasks(self, max_age_hours: int = 24):
         """Clean up completed tasks older than max_age_hours"""
-        current_time = datetime.now()
+        cutoff = time.monotonic() - max_age_hours * 3600
         to_remove = []
 
-        async with self._lock:
-            for task_id, task in self.tasks.items():
-                if task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED]:
-                    task_time = datetime.fromisoformat(task.created_at)
-                    age_hours = (current_time - task_time).total_seconds() / 3600
-                    if age_hours > max_age_hours:
-                        to_remove.append(task_id)
+        for task_id, task in list(self.tasks.items()):
+            if task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED] and task.created_monotonic < cutoff:
+                to_remove.append(task_id)
 
-            for task_id in to_remove:
-                del self.tasks[task_id]
+        for task_id in to_remove:
+            del self.tasks[task_id]
 
         if to_remove:
-            logger.info(f"Cleaned up {len(to_remove)} old tasks")
+            logger.info("Cleaned up %d old tasks", len(to_remove))
             
-    async def _process_task_async(self, task_id: str):
-        """Process a synthesis task asynchronously - NO LIMITS, full parallel!"""
-        # REMOVED: semaphore - No concurrent limits!
-        async with self._lock:
+    async def _dispatch_loop(self):
+        """Coalesce tasks arriving within the batch window and dispatch them as one batch"""
+        loop = asyncio.get_running_loop()
+        while self.running:
+            batch = [await self._queue.get()]
+
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Blocks while every worker is busy, so tasks queued meanwhile join the next batch
+            await self._batches.put(batch)
+
+    async def _worker(self):
+        """Process batches one at a time; max_concurrent workers bound synthesis concurrency"""
+        while self.running:
+            task_ids = await self._batches.get()
+            try:
+                await self._process_batch_async(task_ids)
+            except Exception:
+                logger.exception("Async synthesis batch failed")
+
+    async def _process_batch_async(self, task_ids: List[str]):
+        """Process a batch of synthesis tasks - tasks sharing a voice reuse its prompt features"""
+        tasks: List[AsyncTask] = []
+        for task_id in task_ids:
             task = self.tasks.get(task_id)
-            if not task:
-                return
+            # Skip tasks removed or cancelled while queued
+            if not task or task.status != TaskStatus.PENDING:
+                continue
 
             # Add to running tasks
             self.running_tasks.add(task_id)
             task.status = TaskStatus.PROCESSING
-            task.progress = 0.1
-            task.message = "Starting synthesis..."
+            task.progress = 0.3
+            task.message = "Synthesizing audio..."
+            self._notify(task)
+            tasks.append(task)
 
-        try:
-            logger.info(f"Processing task {task_id}")
+        if not tasks:
+            return
+
+        logger.info("Processing batch of %d tasks", len(tasks))
 
-            # Create synthesis request
-            from app.models.synthesis import CrossLingualWithCacheRequest
-            synthesis_request = CrossLingualWithCacheRequest(
+        # Create synthesis requests
+        synthesis_requests = [
+            CrossLingualWithCacheRequest(
                 text=task.request.text,
                 voice_id=task.request.voice_id,
-                prompt_text=task.request.prompt_text,
-                instruct_text=task.request.instruct_text,
                 format=task.request.format,
                 speed=task.request.speed,
                 stream=False  # Always non-streaming for async
             )
+            for task in tasks
+        ]
 
-            # Update progress
-            async with self._lock:
-                task.progress = 0.3
-                task.message = "Synthesizing audio..."
-
+        try:
             # Run synthesis (this is the main work)
-            result = await self.synthesis_engine.synthesize_cross_lingual_with_cache(synthesis_request)
-
-            # Update task with results
-            async with self._lock:
-                task.status = TaskStatus.COMPLETED
-                task.progress = 1.0
-                task.message = "Synthesis completed successfully"
-                task.audio_url = result.audio_url
-                task.file_path = result.file_path
-                task.duration = result.duration
-                task.synthesis_time = result.synthesis_time
-                task.completed_at = datetime.now().isoformat()
-
-            logger.info(f"Task {task_id} completed successfully")
-
-            # Call callback URL if provided
-            if task.request.callback_url:
-                await self._call_callback_async(task.request.callback_url, task)
-
+            results = await self.synthesis_engine.synthesize_cross_lingual_batch(synthesis_requests)
         except Exception as e:
-            logger.error(f"Task {task_id} failed: {e}")
-
-            async with self._lock:
+            results = [e] * len(tasks)
+
+        # Scatter results to the whole batch
+        completed_at = datetime.now()
+        for task, result in zip(tasks, results):
+            task.completed_at = completed_at
+            self.running_tasks.discard(task.task_id)
+            if isinstance(result, Exception):
+                logger.error("Task %s failed: %s", task.task_id, result)
                 task.status = TaskStatus.FAILED
                 task.progress = 0.0
                 task.message = "Synthesis failed"
-                task.error_message = str(e)
-                task.completed_at = datetime.now().isoformat()
-
-        finally:
-            # Remove from running tasks
-            async with self._lock:
-                self.running_tasks.discard(task_id)
-                
-    async def _call_callback_async(self, callback_url: str, task: AsyncTask):
-        """Call callback URL when task is completed"""
-        try:
-            import aiohttp
+                task.error_message = str(result)
+                self._notify(task)
+                continue
+
+            task.status = TaskStatus.COMPLETED
+            task.progress = 1.0
+            task.message = "Synthesis completed successfully"
+            task.audio_url = result.audio_url
+            task.file_path = result.file_path
+            task.duration = result.duration
+            task.synthesis_time = result.synthesis_time
+            self._notify(task)
+            logger.info("Task %s completed successfully", task.task_id)
+
+            # Deliver the callback in the background so it does not hold up the worker
+            if task.request.callback_url:
+                callback = asyncio.create_task(self._call_callback_async(task.request.callback_url, task))
+                self._callbacks.add(callback)
+                callback.add_done_callback(self._callbacks.discard)
+
+    def _get_http(self):
+        """Session shared by all callbacks, so deliveries reuse pooled connections and cached DNS"""
+        if self._http is None:
+            self._http = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=CALLBACK_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300)
+            )
+        return self._http
 
-            callback_data = {
-                "task_id": task.task_id,
-                "status": task.status,
-                "audio_url": task.audio_url,
-                "duration": task.duration,
-                "synthesis_time": task.synthesis_time,
-                "completed_at": task.completed_at
-            }
+    async def _call_callback_async(self, callback_url: str, task: AsyncTask):
+        """Call callback URL when task is completed, retrying 5xx and network errors with backoff"""
+        callback_data = orjson.dumps({
+            "task_id": task.task_id,
+            "status": task.status,
+            "audio_url": task.audio_url,
+            "duration": task.duration,
+            "synthesis_time": task.synthesis_time,
+            "completed_at": task.completed_at
+        })
+
+        for attempt in range(CALLBACK_ATTEMPTS):
+            try:
+                async with self._get_http().post(
+                    callback_url, data=callback_data, headers={"Content-Type": "application/json"}
+                ) as response:
+                    if response.status < 500:
+                        logger.info("Callback sent to %s for task %s: %s", callback_url, task.task_id, response.status)
+                        return
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+            except Exception as e:
+                logger.error("Failed to call callback %s for task %s: %s", callback_url, task.task_id, e)
+                return
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(callback_url, json=callback_data, timeout=10) as response:
-                    logger.info(f"Callback sent to {callback_url} for task {task.task_id}: {response.status}")
+            if attempt + 1 < CALLBACK_ATTEMPTS:
+                await asyncio.sleep(CALLBACK_BACKOFF * 2 ** attempt)
 
-        except Exception as e:
-            logger.error(f"Failed to call callback {callback_url} for task {task.task_id}: {e}")
+        logger.error("Failed to call callback %s for task %s after %d attempts: %s",
+                     callback_url, task.task_id, CALLBACK_ATTEMPTS, error)
@@ -3,70 +3,63 @@ Configuration settings for CosyVoice2 API
 """
 
 import os
+from functools import lru_cache
 from typing import List, Optional
 
 try:
-    # Pydantic v2 - try pydantic-settings first
-    from pydantic_settings import BaseSettings
+    from pydantic_settings import BaseSettings, SettingsConfigDict
     from pydantic import Field
-    PYDANTIC_SETTINGS_AVAILABLE = True
-except ImportError:
-    try:
-        # Install pydantic-settings automatically
-        import subprocess
-        import sys
-        print("Installing pydantic-settings...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "pydantic-settings>=2.0.0"])
-        from pydantic_settings import BaseSettings
-        from pydantic import Field
-        PYDANTIC_SETTINGS_AVAILABLE = True
-        print("✓ pydantic-settings installed successfully")
-    except Exception:
-        # Last resort - try pydantic v1 style (will likely fail with v2)
-        try:
-            from pydantic import BaseSettings, Field
-            PYDANTIC_SETTINGS_AVAILABLE = False
-            print("⚠️  Using legacy BaseSettings - may not work with Pydantic v2")
-        except ImportError:
-            raise ImportError(
-                "Cannot import BaseSettings. Please install pydantic-settings: "
-                "pip install pydantic-settings>=2.0.0"
-            )
+except ImportError as e:
+    raise ImportError(
+        "Cannot import BaseSettings. Please install pydantic-settings: "
+        "pip install pydantic-settings>=2.0.0"
+    ) from e
 
 
 class Settings(BaseSettings):
-    """Application settings"""
+    """Application settings; each field is read from the environment variable of the same name"""
+    
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=True, extra="ignore")
     
     # Server settings
-    HOST: str = Field(default="0.0.0.0", env="HOST")
-    PORT: int = Field(default=8000, env="PORT")
-    DEBUG: bool = Field(default=False, env="DEBUG")
+    HOST: str = Field(default="0.0.0.0")
+    PORT: int = Field(default=8000)
+    DEBUG: bool = Field(default=False)
     
     # CORS settings
-    ALLOWED_ORIGINS: List[str] = Field(
-        default=["*"], 
-        env="ALLOWED_ORIGINS"
-    )
+    ALLOWED_ORIGINS: List[str] = Field(default=["*"])
     
     # Model settings
     MODEL_DIR: str = Field(
         default="models/CosyVoice2-0.5B",
-        env="MODEL_DIR",
         description="Path to CosyVoice model directory"
     )
     
     # Voice cache settings
     VOICE_CACHE_DIR: str = Field(
         default="voice_cache",
-        env="VOICE_CACHE_DIR",
         description="Directory to store cached voices"
     )
     
     VOICE_CACHE_DB: str = Field(
         default="voice_cache/voices.json",
-        env="VOICE_CACHE_DB",
         description="Path to voice cache database file"
     )
+
+    EMBEDDING_CACHE_SIZE: int = Field(
+        default=50,
+        description="Maximum number of prompt audio embeddings kept in memory"
+    )
+
+    EMBEDDING_CACHE_FILE: str = Field(
+        default="voice_cache/prompt_embeddings.pt",
+        description="Path to persisted prompt audio embeddings"
+    )
+
+    PRELOAD_VOICE_FEATURES: bool = Field(
+        default=True,
+        description="Extract cached voices' prompt features at startup and on creation instead of on first use"
+    )
     
     # Audio settings
     SUPPORTED_AUDIO_FORMATS: List[str] = Field(
@@ -76,65 +69,134 @@ class Settings(BaseSettings):
     
     MAX_AUDIO_DURATION: int = Field(
         default=30,
-        env="MAX_AUDIO_DURATION",
         description="Maximum audio duration in seconds for voice cloning"
     )
     
     SAMPLE_RATE: int = Field(
         default=22050,
-        env="SAMPLE_RATE",
         description="Audio sample rate"
     )
     
     # Processing settings
     MAX_TEXT_LENGTH: int = Field(
         default=1000,
-        env="MAX_TEXT_LENGTH",
         description="Maximum text length for synthesis"
     )
     
     DEFAULT_SPEED: float = Field(
         default=1.0,
-        env="DEFAULT_SPEED",
         description="Default synthesis speed"
     )
     
+    SYNTH_WORKERS: int = Field(
+        default=1,
+        description="Threads running model calls (feature extraction and synthesis); one per model replica"
+    )
+    
+    COMPILE_INFERENCE: bool = Field(
+        default=False,
+        description="Compile the flow estimator and vocoder with torch.compile at model load, warming them up at startup"
+    )
+    
+    FP16: bool = Field(
+        default=False,
+        description="Run the LLM and flow in FP16 under autocast (the vocoder stays FP32); CUDA only"
+    )
+    
+    LOAD_JIT: bool = Field(
+        default=False,
+        description="Load the TorchScript exports shipped in MODEL_DIR (flow encoder; CosyVoice 1 also its LLM); CUDA only"
+    )
+    
+    LOAD_TRT: bool = Field(
+        default=False,
+        description="Run the flow estimator as a TensorRT engine, built into MODEL_DIR on first load; CUDA only"
+    )
+    
+    LOAD_VLLM: bool = Field(
+        default=False,
+        description="Run the CosyVoice2 LLM on vLLM (preallocated KV cache, CUDA graph decode); requires vllm"
+    )
+    
+    SYNTH_WORKER_CONCURRENCY: int = Field(
+        default=4,
+        description="Maximum number of async synthesis batches processed concurrently"
+    )
+
+    ASYNC_BATCH_SIZE: int = Field(
+        default=8,
+        description="Maximum number of async tasks coalesced into one synthesis batch"
+    )
+
+    ASYNC_BATCH_WINDOW_MS: float = Field(
+        default=5.0,
+        description="Time window for coalescing async tasks into a batch (milliseconds)"
+    )
+    
+    ASYNC_MAX_TASKS: int = Field(
+        default=10000,
+        description="Maximum number of async tasks kept (least recently used finished tasks are evicted)"
+    )
+    
+    ASYNC_QUEUE_SIZE: int = Field(
+        default=1000,
+        description="Maximum number of queued async tasks before new ones are rejected with 429"
+    )
+    
+    TASK_BROKER_URL: Optional[str] = Field(
+        default=None,
+        description="Redis URL for the Celery task queue and task state (in-process when unset)"
+    )
+
+    TASK_TTL: int = Field(
+        default=3600,
+        description="Seconds finished tasks (and completed-result markers) are kept before being reaped or expiring"
+    )
+
+    TASK_STORE_MAX_SIZE: int = Field(
+        default=10000,
+        description="Maximum number of in-process task records (least recently updated are evicted)"
+    )
+    
     # File upload settings
     MAX_FILE_SIZE: int = Field(
         default=50 * 1024 * 1024,  # 50MB
-        env="MAX_FILE_SIZE",
         description="Maximum file upload size in bytes"
     )
     
+    MAX_REQUEST_SIZE: int = Field(
+        default=20 * 1024 * 1024,  # 20MB
+        description="Maximum request body size in bytes outside voice uploads (which use MAX_FILE_SIZE)"
+    )
+    
     # Output settings
     OUTPUT_DIR: str = Field(
         default="outputs",
-        env="OUTPUT_DIR",
         description="Directory for generated audio files"
     )
     
     # Cleanup settings
     CLEANUP_INTERVAL: int = Field(
         default=3600,  # 1 hour
-        env="CLEANUP_INTERVAL",
         description="Interval for cleaning up temporary files (seconds)"
     )
     
     TEMP_FILE_LIFETIME: int = Field(
         default=7200,  # 2 hours
-        env="TEMP_FILE_LIFETIME",
         description="Lifetime of temporary files (seconds)"
     )
-    
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """The process-wide settings, read from the environment and .env once"""
+    return Settings()
 
 
 # Create global settings instance
-settings = Settings()
+settings = get_settings()
 
-# Ensure required directories exist
-os.makedirs(settings.VOICE_CACHE_DIR, exist_ok=True)
-os.makedirs(settings.OUTPUT_DIR, exist_ok=True)
-os.makedirs(os.path.dirname(settings.VOICE_CACHE_DB), exist_ok=True)
+# Ensure required directories exist: each distinct one is stat'ed once and only created when missing
+for _directory in {settings.VOICE_CACHE_DIR, settings.OUTPUT_DIR, os.path.dirname(settings.VOICE_CACHE_DB)}:
+    if _directory and not os.path.isdir(_directory):
+        os.makedirs(_directory, exist_ok=True)
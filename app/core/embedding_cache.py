@@ -0,0 +1,85 @@
+"""
+Prompt embedding cache for CosyVoice2 API
+Caches the speaker embedding, prompt speech tokens and prompt speech features
+extracted from reference audio, keyed by the BLAKE2b-128 digest of the audio content
+"""
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Frontend outputs that depend on the text rather than the prompt audio
+TEXT_KEYS = ('text', 'text_len', 'prompt_text', 'prompt_text_len')
+
+
+class VoiceEmbeddingCache:
+    """LRU cache of prompt features extracted by the CosyVoice frontend"""
+
+    def __init__(self, capacity: int = 50, persist_path: Optional[str] = None):
+        self.capacity = capacity
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get cached prompt features, marking the entry as recently used"""
+        async with self._lock:
+            features = self._entries.get(key)
+            if features is not None:
+                self._entries.move_to_end(key)
+            return features
+
+    async def put(self, key: str, features: Dict[str, Any]):
+        """Store prompt features, evicting the least recently used entry"""
+        features = {k: v for k, v in features.items() if k not in TEXT_KEYS}
+        async with self._lock:
+            self._entries[key] = features
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    async def discard(self, key: str):
+        """Remove an entry, if present"""
+        async with self._lock:
+            self._entries.pop(key, None)
+
+    async def load(self):
+        """Load persisted prompt features (spk2info.pt style) from disk"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+
+        try:
+            import torch
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(
+                None, lambda: torch.load(self.persist_path, map_location='cpu')
+            )
+            async with self._lock:
+                for key, features in list(data.items())[-self.capacity:]:
+                    self._entries[key] = features
+            logger.info("Loaded %d cached prompt embeddings from %s", len(data), self.persist_path)
+        except Exception as e:
+            logger.warning("Failed to load prompt embedding cache: %s", e)
+
+    async def save(self):
+        """Persist prompt features to disk so warm restarts skip recomputation"""
+        if not self.persist_path:
+            return
+
+        try:
+            import torch
+            async with self._lock:
+                data = dict(self._entries)
+            temp_path = f"{self.persist_path}.tmp"
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, torch.save, data, temp_path)
+            os.replace(temp_path, self.persist_path)
+        except Exception as e:
+            logger.warning("Failed to save prompt embedding cache: %s", e)
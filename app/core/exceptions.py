@@ -5,7 +5,8 @@ Exception handlers for CosyVoice2 API
 import logging
 from typing import Union
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
@@ -42,104 +43,57 @@ class SynthesisError(VoiceManagerError):
     pass
 
 
+class QueueFullError(VoiceManagerError):
+    """Exception raised when the async synthesis queue cannot take more tasks"""
+    pass
+
+
+# Voice manager errors: (HTTP status, error code, log level), looked up along the exception's MRO
+_ERROR_MAP = {
+    VoiceNotFoundError: (404, "voice_not_found", logging.WARNING),
+    VoiceAlreadyExistsError: (409, "voice_already_exists", logging.WARNING),
+    AudioProcessingError: (422, "audio_processing_error", logging.ERROR),
+    ModelNotReadyError: (503, "model_not_ready", logging.ERROR),
+    QueueFullError: (429, "queue_full", logging.WARNING),
+    SynthesisError: (500, "synthesis_error", logging.ERROR),
+    VoiceManagerError: (500, "voice_manager_error", logging.ERROR),
+}
+
+
+def _error_response(request: Request, status_code: int, error: str, message, **details) -> ORJSONResponse:
+    """Error body shared by all handlers, serialized with orjson; the path is the raw request path, not the rebuilt URL"""
+    return ORJSONResponse(
+        status_code=status_code,
+        content={"error": error, "message": message, "details": {"path": request.url.path, **details}}
+    )
+
+
 def setup_exception_handlers(app: FastAPI):
     """Setup exception handlers for the FastAPI app"""
     
-    @app.exception_handler(VoiceNotFoundError)
-    async def voice_not_found_handler(request: Request, exc: VoiceNotFoundError):
-        logger.warning(f"Voice not found: {exc}")
-        return JSONResponse(
-            status_code=404,
-            content={
-                "error": "voice_not_found",
-                "message": str(exc),
-                "details": {"path": str(request.url)}
-            }
-        )
-    
-    @app.exception_handler(VoiceAlreadyExistsError)
-    async def voice_already_exists_handler(request: Request, exc: VoiceAlreadyExistsError):
-        logger.warning(f"Voice already exists: {exc}")
-        return JSONResponse(
-            status_code=409,
-            content={
-                "error": "voice_already_exists",
-                "message": str(exc),
-                "details": {"path": str(request.url)}
-            }
-        )
-    
-    @app.exception_handler(AudioProcessingError)
-    async def audio_processing_error_handler(request: Request, exc: AudioProcessingError):
-        logger.error(f"Audio processing error: {exc}")
-        return JSONResponse(
-            status_code=422,
-            content={
-                "error": "audio_processing_error",
-                "message": str(exc),
-                "details": {"path": str(request.url)}
-            }
-        )
-    
-    @app.exception_handler(ModelNotReadyError)
-    async def model_not_ready_handler(request: Request, exc: ModelNotReadyError):
-        logger.error(f"Model not ready: {exc}")
-        return JSONResponse(
-            status_code=503,
-            content={
-                "error": "model_not_ready",
-                "message": str(exc),
-                "details": {"path": str(request.url)}
-            }
-        )
-    
-    @app.exception_handler(SynthesisError)
-    async def synthesis_error_handler(request: Request, exc: SynthesisError):
-        logger.error(f"Synthesis error: {exc}")
-        return JSONResponse(
-            status_code=500,
-            content={
-                "error": "synthesis_error",
-                "message": str(exc),
-                "details": {"path": str(request.url)}
-            }
+    @app.exception_handler(VoiceManagerError)
+    async def voice_manager_error_handler(request: Request, exc: VoiceManagerError):
+        status_code, error, level = next(
+            _ERROR_MAP[cls] for cls in type(exc).__mro__ if cls in _ERROR_MAP
         )
+        logger.log(level, "%s: %s", error, exc)
+        return _error_response(request, status_code, error, str(exc))
     
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(request: Request, exc: RequestValidationError):
-        logger.warning(f"Validation error: {exc}")
-        return JSONResponse(
-            status_code=422,
-            content={
-                "error": "validation_error",
-                "message": "Request validation failed",
-                "details": {
-                    "path": str(request.url),
-                    "errors": exc.errors()
-                }
-            }
+        logger.warning("Validation error: %s", exc)
+        return _error_response(
+            request, 422, "validation_error", "Request validation failed",
+            # Error contexts can hold exception objects, which orjson cannot serialize
+            errors=jsonable_encoder(exc.errors())
         )
     
     @app.exception_handler(StarletteHTTPException)
     async def http_exception_handler(request: Request, exc: StarletteHTTPException):
-        logger.warning(f"HTTP exception: {exc.status_code} - {exc.detail}")
-        return JSONResponse(
-            status_code=exc.status_code,
-            content={
-                "error": "http_error",
-                "message": exc.detail,
-                "details": {"path": str(request.url)}
-            }
-        )
+        logger.warning("HTTP exception: %s - %s", exc.status_code, exc.detail)
+        return _error_response(request, exc.status_code, "http_error", exc.detail)
     
     @app.exception_handler(Exception)
     async def general_exception_handler(request: Request, exc: Exception):
-        logger.error(f"Unhandled exception: {exc}", exc_info=True)
-        return JSONResponse(
-            status_code=500,
-            content={
-                "error": "internal_server_error",
-                "message": "An unexpected error occurred",
-                "details": {"path": str(request.url)}
-            }
-        )
+        logger.error("Unhandled exception: %s", exc, exc_info=True)
+        return _error_response(request, 500, "internal_server_error", "An unexpected error occurred")
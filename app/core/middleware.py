@@ -0,0 +1,56 @@
+"""
+ASGI middleware for CosyVoice2 API
+"""
+
+from typing import Dict, Optional
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class ContentSizeLimitMiddleware:
+    """
+    Reject request bodies over a size limit before they are buffered
+    A declared Content-Length over the limit is answered with 413 without reading the body;
+    chunked bodies are counted as they are received and fail with 413 once they cross the limit
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_size = max_size
+        # Path prefix -> limit, for routes that accept larger (or smaller) bodies
+        self.path_limits = path_limits or {}
+
+    def _limit_for(self, path: str) -> int:
+        for prefix, limit in self.path_limits.items():
+            if path.startswith(prefix):
+                return limit
+        return self.max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self._limit_for(scope["path"])
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > limit:
+                    response = JSONResponse({"detail": "Request body too large"}, status_code=413)
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
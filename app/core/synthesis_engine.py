@@ -4,13 +4,18 @@ Handles voice synthesis operations
 """
 
 import os
+import re
+import struct
+import time
 import asyncio
+import concurrent.futures
+import functools
 import logging
-import tempfile
-import uuid
-from typing import Optional, Generator, Any, Dict
+import threading
+from typing import Optional, Generator, Any, AsyncIterator, Dict, List, Tuple, Union
 from pathlib import Path
 
+import aiofiles.os
 import torch
 import torchaudio
 import soundfile as sf
@@ -18,15 +23,15 @@ import librosa
 from cosyvoice.utils.file_utils import load_wav
 from cosyvoice.utils.common import set_all_random_seed
 
-from app.core.voice_manager import VoiceManager
+from app.core.voice_manager import VoiceManager, voice_features_key
 from app.models.synthesis import (
     CrossLingualWithAudioRequest, CrossLingualWithCacheRequest,
     SynthesisResponse, AudioFormat
 )
 from app.core.config import settings
 from app.core.exceptions import SynthesisError, VoiceNotFoundError, ModelNotReadyError
-from app.utils.file_utils import file_manager
-from app.utils.audio import audio_processor
+from app.core.embedding_cache import TEXT_KEYS
+from app.utils.file_utils import file_manager, AUDIO_URL_TMPL
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +39,41 @@ logger = logging.getLogger(__name__)
 MAX_VAL = 0.8
 PROMPT_SR = 16000
 
+# Prompt features that cross-lingual mode removes from the LLM input
+LLM_PROMPT_KEYS = ('llm_prompt_speech_token', 'llm_prompt_speech_token_len')
+
+# soundfile subtype per output extension; WAV keeps float32 samples like torchaudio.save did,
+# other formats use soundfile's default for the container
+OUTPUT_SUBTYPES = {'.wav': 'FLOAT'}
+
+# RIFF and data chunk size of a streamed WAV, whose length is unknown when the header is sent
+STREAM_WAV_SIZE = 0xFFFFFFFF
+
+# Hiragana and katakana, which mark text as Japanese
+JAPANESE_KANA = re.compile(r'[\u3040-\u309f\u30a0-\u30ff]')
+
+# Per synthesis thread state: the CUDA stream that thread's model calls are issued on
+_synth_thread = threading.local()
+
+
+def _init_synth_thread():
+    """Give each synthesis thread its own CUDA stream, so its kernels and copies do not
+    serialize behind unrelated work queued on the default stream"""
+    if torch.cuda.is_available():
+        _synth_thread.stream = torch.cuda.Stream()
+
+
+def _run_on_synth_stream(func):
+    """Run func on the calling synthesis thread's CUDA stream"""
+    stream = getattr(_synth_thread, 'stream', None)
+    if stream is None:
+        return func()
+    with torch.cuda.stream(stream):
+        result = func()
+    # Tensors produced here (e.g. cached prompt features) may be read from another thread's stream
+    stream.synchronize()
+    return result
+
 def detect_language_and_add_tags(text: str) -> str:
     """
     DISABLED - Cross-lingual synthesis không cần language tags
@@ -56,53 +96,175 @@ def postprocess(speech, sample_rate, top_db=60, hop_length=220, win_length=440):
     speech = torch.concat([speech, torch.zeros(1, int(sample_rate * 0.2))], dim=1)
     return speech
 
+@functools.lru_cache(maxsize=16)
+def _prompt_resampler(sample_rate: int) -> torchaudio.transforms.Resample:
+    """Resampler from sample_rate to PROMPT_SR; its sinc kernel is built once per input rate"""
+    return torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=PROMPT_SR)
+
+def resample_prompt_speech(speech: torch.Tensor, sample_rate: int) -> torch.Tensor:
+    """Resample decoded mono prompt speech to PROMPT_SR, matching cosyvoice's load_wav"""
+    if sample_rate != PROMPT_SR:
+        if sample_rate < PROMPT_SR:
+            raise ValueError(f"Prompt audio sample rate {sample_rate} must be at least {PROMPT_SR}")
+        speech = _prompt_resampler(sample_rate)(speech)
+    return speech
+
+
+def generation_limits(text: str, speed: float, sample_rate: int) -> Tuple[int, int]:
+    """
+    Anti-hallucination caps for cached-voice synthesis: (max chunks, max samples)
+    Japanese text gets a lower chunk cap; samples are capped at 5x the expected duration
+    """
+    is_japanese = bool(JAPANESE_KANA.search(text))
+    if is_japanese:
+        logger.info("🇯🇵 Japanese detected - applying anti-hallucination measures")
+    max_chunks = 100 if is_japanese else 200
+    expected_duration = len(text) * 0.15 / speed  # CRITICAL FIX: Adjust for speed!
+    max_samples = int(sample_rate * expected_duration * 5)
+    logger.debug("🎯 Generation limits: max_chunks=%d, max_samples=%d", max_chunks, max_samples)
+    return max_chunks, max_samples
+
+
+def write_speech(synthesis_generator, output_path: str, sample_rate: int,
+                 max_chunks: Optional[int] = None, max_samples: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Write each tts_speech chunk of a synthesis generator to output_path as soon as it is produced,
+    rather than collecting the whole utterance and concatenating it before saving
+    Generation stops after max_chunks chunks, or once more than max_samples samples were written
+    Returns: (samples written, chunks written)
+    """
+    samples = chunks = 0
+    subtype = OUTPUT_SUBTYPES.get(os.path.splitext(output_path)[1].lower())
+    try:
+        with sf.SoundFile(output_path, 'w', samplerate=sample_rate, channels=1, subtype=subtype) as f:
+            # CosyVoice's tts() yields exactly one {'tts_speech': chunk} per chunk, already copied to
+            # the host on the synthesis thread's stream, so no key check or transfer is needed here
+            for model_output in synthesis_generator:
+                chunk = model_output['tts_speech'].numpy().reshape(-1)
+                f.write(chunk)
+                samples += len(chunk)
+                chunks += 1
+                logger.debug("📊 Wrote chunk %d: %d samples, total: %d", chunks, len(chunk), samples)
+
+                # Anti-hallucination: stop after writing the chunk that reached a limit
+                if max_chunks is not None and chunks >= max_chunks:
+                    logger.warning("🛑 Stopping generation: reached max chunks (%d) - but keeping current audio", max_chunks)
+                    break
+                if max_samples is not None and samples > max_samples:
+                    logger.warning("🛑 Stopping generation: exceeded max samples (%d) - but keeping current audio", max_samples)
+                    break
+    except BaseException:
+        file_manager.delete_file(output_path)
+        raise
+
+    if not chunks:
+        file_manager.delete_file(output_path)
+        raise SynthesisError("No audio generated")
+    return samples, chunks
+
+
+def wav_stream_header(sample_rate: int) -> bytes:
+    """Header of a mono 16-bit PCM WAV stream of unknown length"""
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI', b'RIFF', STREAM_WAV_SIZE, b'WAVE', b'fmt ', 16, 1, 1,
+        sample_rate, sample_rate * 2, 2, 16, b'data', STREAM_WAV_SIZE
+    )
+
+
+def extract_prompt_features(model, prompt_speech_16k) -> Dict[str, Any]:
+    """Run the CosyVoice frontend over prompt audio once (speaker embedding, speech tokens, speech feat)"""
+    model_input = model.frontend.frontend_zero_shot('', '', prompt_speech_16k, model.sample_rate, '')
+    return {key: value for key, value in model_input.items() if key not in TEXT_KEYS}
+
+def inference_with_prompt_features(model, text: str, prompt_features: Dict[str, Any],
+                                   prompt_text: Optional[str] = None, stream: bool = False,
+                                   speed: float = 1.0):
+    """
+    Same as model.inference_zero_shot / inference_cross_lingual but reuses precomputed prompt features
+    instead of re-running the speech tokenizer and speaker encoder.
+    prompt_text=None selects cross-lingual mode (prompt removed from the LLM input).
+    """
+    frontend = model.frontend
+    if prompt_text is not None:
+        prompt_text = frontend.text_normalize(prompt_text, split=False)
+        prompt_text_token, prompt_text_token_len = frontend._extract_text_token(prompt_text)
+
+    for segment in frontend.text_normalize(text, split=True):
+        model_input = dict(prompt_features)
+        model_input['text'], model_input['text_len'] = frontend._extract_text_token(segment)
+        if prompt_text is None:
+            for key in LLM_PROMPT_KEYS:
+                model_input.pop(key, None)
+        else:
+            model_input['prompt_text'] = prompt_text_token
+            model_input['prompt_text_len'] = prompt_text_token_len
+        yield from model.model.tts(**model_input, stream=stream, speed=speed)
+
 
 class SynthesisEngine:
     """Voice synthesis engine"""
     
     def __init__(self, voice_manager: VoiceManager):
         self.voice_manager = voice_manager
+        # Model calls get their own threads, SYNTH_WORKERS at a time, so forward passes neither
+        # contend for the GPU nor occupy the default executor used for file I/O
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=settings.SYNTH_WORKERS, thread_name_prefix="synth",
+            initializer=_init_synth_thread
+        )
+        # Prompt feature extractions in flight, by embedding cache key; concurrent misses for the
+        # same prompt wait on one extraction instead of each running the frontend
+        self._extracting: Dict[str, asyncio.Task] = {}
+
+    async def _run_on_gpu(self, func):
+        """Run a blocking model call on the synthesis threads, each with its own CUDA stream"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, _run_on_synth_stream, func)
     
-    async def synthesize_cross_lingual_with_audio(self, request: CrossLingualWithAudioRequest) -> SynthesisResponse:
-        """跨语种复刻 - 带音频文件 (Cross-lingual voice cloning with audio file)"""
+    async def synthesize_cross_lingual_with_audio(self, request: CrossLingualWithAudioRequest,
+                                                  prompt_features: Optional[Dict[str, Any]] = None,
+                                                  prompt_speech_16k: Optional[torch.Tensor] = None) -> SynthesisResponse:
+        """跨语种复刻 - 带音频文件 (Cross-lingual voice cloning with audio file)
+
+        prompt_features may be passed when the caller already holds cached features for the prompt audio;
+        prompt_speech_16k (already decoded) replaces loading request.prompt_audio_url.
+        """
         try:
             model = self.voice_manager._get_active_model()
             if not model:
                 raise ModelNotReadyError("CosyVoice model not ready")
 
-            # Load prompt audio
-            prompt_audio_path = await self._resolve_audio_path(request.prompt_audio_url)
-            if not os.path.exists(prompt_audio_path):
-                raise FileNotFoundError(f"Prompt audio file not found: {prompt_audio_path}")
+            # Load prompt features (cached by audio content hash)
+            if prompt_features is None:
+                prompt_features = await self._get_prompt_features(
+                    model, request.prompt_audio_url, request.prompt_audio_key, prompt_speech_16k
+                )
 
             # Generate unique output filename
-            output_filename = f"cross_lingual_{uuid.uuid4().hex[:8]}.{request.format.value}"
+            output_filename = f"cross_lingual_{os.urandom(4).hex()}.{request.format.value}"
             output_path = file_manager.get_output_audio_path(output_filename)
 
-            # Ensure output directory exists
-            file_manager.ensure_directory_exists(os.path.dirname(output_path))
-
             # Perform synthesis
             if request.instruct_text:
-                # Use instruct mode for fine-grained control
-                synthesis_time = await self._synthesize_with_instruct(
-                    model, request.text, request.prompt_text, prompt_audio_path,
-                    request.instruct_text, output_path, request.speed, request.stream
+                # Repo gốc CosyVoice: inference_cross_lingual chỉ cần text (không cần language tags)
+                # Model tự detect language từ text content
+                logger.info("Using cross-lingual mode (exact match với repo gốc): text='%s'", request.text)
+                logger.info("Note: instruct_text ignored in cross-lingual mode (như repo gốc): '%.50s...'", request.instruct_text)
+                if request.prompt_text:
+                    logger.info("Note: prompt_text ignored in cross-lingual mode (như repo gốc): '%.50s...'", request.prompt_text)
+                synthesis_time, duration = await self._run_inference(
+                    model, request.text, prompt_features, output_path, request.speed, request.stream
                 )
             else:
                 # Use zero-shot mode
-                synthesis_time = await self._synthesize_with_zero_shot(
-                    model, request.text, request.prompt_text, prompt_audio_path,
-                    output_path, request.speed, request.stream
+                synthesis_time, duration = await self._run_inference(
+                    model, detect_language_and_add_tags(request.text), prompt_features,
+                    output_path, request.speed, request.stream, prompt_text=request.prompt_text
                 )
 
-            # Get audio duration
-            duration = await self._get_audio_duration(output_path)
-
             return SynthesisResponse(
                 success=True,
                 message="跨语种复刻合成完成 (Cross-lingual synthesis completed)",
-                audio_url=f"/api/v1/audio/{output_filename}",
+                audio_url=AUDIO_URL_TMPL(output_filename),
                 file_path=output_path,
                 duration=duration,
                 format=request.format,
@@ -113,8 +275,12 @@ class SynthesisEngine:
             logger.error(f"Error in cross-lingual synthesis with audio: {e}")
             raise SynthesisError(f"Cross-lingual synthesis failed: {str(e)}")
 
-    async def synthesize_cross_lingual_with_cache(self, request: CrossLingualWithCacheRequest) -> SynthesisResponse:
-        """跨语种复刻 - 使用缓存语音 (Cross-lingual voice cloning with cached voice)"""
+    async def synthesize_cross_lingual_with_cache(self, request: CrossLingualWithCacheRequest,
+                                                  prompt_features: Optional[Dict[str, Any]] = None) -> SynthesisResponse:
+        """跨语种复刻 - 使用缓存语音 (Cross-lingual voice cloning with cached voice)
+
+        prompt_features may be passed when the caller already extracted them for this voice.
+        """
         try:
             model = self.voice_manager.get_model_directly()  # Direct access for parallel processing
             if not model:
@@ -126,26 +292,26 @@ class SynthesisEngine:
                 raise VoiceNotFoundError(f"Cached voice '{request.voice_id}' not found")
 
             # Generate unique output filename
-            output_filename = f"cross_lingual_cache_{uuid.uuid4().hex[:8]}.{request.format.value}"
+            output_filename = f"cross_lingual_cache_{os.urandom(4).hex()}.{request.format.value}"
             output_path = file_manager.get_output_audio_path(output_filename)
 
-            # Ensure output directory exists
-            file_manager.ensure_directory_exists(os.path.dirname(output_path))
+            # Get cached voice prompt features - ALWAYS use cross-lingual (跨语种复刻) as requested
+            if prompt_features is None:
+                prompt_features = await self._get_cached_voice_features(model, request.voice_id)
 
             # Perform synthesis - chỉ sử dụng cross-lingual mode như repo gốc
             # KHÔNG sử dụng instruct_text hay prompt_text
-            synthesis_time = await self._synthesize_cross_lingual_cached(
-                model, request.text, request.voice_id,
-                output_path, request.speed, request.stream
+            logger.info("🎯 USING CROSS-LINGUAL MODE (跨语种复刻) for voice '%s': text='%s'", request.voice_id, request.text)
+            max_chunks, max_samples = generation_limits(request.text, request.speed, model.sample_rate)
+            synthesis_time, duration = await self._run_inference(
+                model, request.text, prompt_features, output_path, request.speed, request.stream,
+                max_chunks=max_chunks, max_samples=max_samples
             )
 
-            # Get audio duration
-            duration = await self._get_audio_duration(output_path)
-
             return SynthesisResponse(
                 success=True,
                 message="跨语种复刻合成完成 (Cross-lingual synthesis completed)",
-                audio_url=f"/api/v1/audio/{output_filename}",
+                audio_url=AUDIO_URL_TMPL(output_filename),
                 file_path=output_path,
                 duration=duration,
                 format=request.format,
@@ -155,210 +321,224 @@ class SynthesisEngine:
         except Exception as e:
             logger.error(f"Error in cross-lingual synthesis with cache: {e}")
             raise SynthesisError(f"Cross-lingual synthesis failed: {str(e)}")
-    
-
-    
-
-    
-
-    
-    async def _synthesize_with_model(self, model, mode: str, text: str, voice_id: str,
-                                   output_path: str, speed: float, stream: bool) -> float:
-        """Common synthesis method"""
-        import time
-        start_time = time.time()
-
-        def _sync_synthesis():
-            if mode == "sft":
-                # SFT synthesis
-                synthesis_generator = model.inference_sft(text, voice_id, stream=stream, speed=speed)
-            else:
-                raise ValueError(f"Unsupported synthesis mode: {mode}")
-
-            # Collect audio chunks
-            audio_chunks = []
-            for model_output in synthesis_generator:
-                if 'tts_speech' in model_output:
-                    audio_chunks.append(model_output['tts_speech'])
 
-            if not audio_chunks:
-                raise SynthesisError("No audio generated")
-
-            # Concatenate audio chunks
-            final_audio = torch.cat(audio_chunks, dim=1)
-
-            # Save audio
-            torchaudio.save(output_path, final_audio, model.sample_rate)
-
-            return time.time() - start_time
-
-        # Run synthesis in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _sync_synthesis)
-
-    async def _synthesize_with_zero_shot(self, model, text: str, prompt_text: str,
-                                       prompt_audio_path: str, output_path: str,
-                                       speed: float, stream: bool) -> float:
-        """Zero-shot synthesis with prompt audio"""
-        import time
-        start_time = time.time()
-
-        def _sync_synthesis():
-            # Load and postprocess prompt audio like in original webui
-            prompt_speech_16k = postprocess(load_wav(prompt_audio_path, PROMPT_SR))
-
-            # Set random seed for reproducible results
+    async def stream_cross_lingual_with_cache(self, request: CrossLingualWithCacheRequest) -> AsyncIterator[bytes]:
+        """
+        Cross-lingual synthesis with a cached voice, streamed as a 16-bit PCM WAV
+        The voice is looked up here, so a missing voice or model raises before any audio is sent;
+        the returned iterator then yields each chunk as soon as the model produces it
+        """
+        model = self.voice_manager.get_model_directly()
+        if not model:
+            raise ModelNotReadyError("CosyVoice model not ready")
+        prompt_features = await self._get_cached_voice_features(model, request.voice_id)
+        max_chunks, max_samples = generation_limits(request.text, request.speed, model.sample_rate)
+        return self._stream_speech(model, request.text, prompt_features, request.speed, max_chunks, max_samples)
+
+    async def _stream_speech(self, model, text: str, prompt_features: Dict[str, Any], speed: float,
+                             max_chunks: int, max_samples: int) -> AsyncIterator[bytes]:
+        """Run streaming inference on a synthesis thread, yielding the WAV header then PCM chunks"""
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        # Set when the client goes away, so the synthesis thread stops at the next chunk
+        stop = threading.Event()
+
+        @torch.inference_mode()
+        def _produce():
             set_all_random_seed(42)
-
-            # Add language tags for better cross-lingual support
-            tagged_text = detect_language_and_add_tags(text)
-
-            # Use zero-shot inference with language tags
-            synthesis_generator = model.inference_zero_shot(
-                tagged_text, prompt_text, prompt_speech_16k, stream=stream, speed=speed
+            synthesis_generator = inference_with_prompt_features(
+                model, text, prompt_features, stream=True, speed=speed
             )
-
-            # Collect audio chunks
-            audio_chunks = []
+            samples = chunk_count = 0
             for model_output in synthesis_generator:
-                if 'tts_speech' in model_output:
-                    audio_chunks.append(model_output['tts_speech'])
-
-            if not audio_chunks:
-                raise SynthesisError("No audio generated")
-
-            # Concatenate audio chunks
-            final_audio = torch.cat(audio_chunks, dim=1)
-
-            # Save audio
-            torchaudio.save(output_path, final_audio, model.sample_rate)
-
-            return time.time() - start_time
-
-        # Run synthesis in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _sync_synthesis)
-
-    async def _synthesize_with_instruct(self, model, text: str, prompt_text: str,
-                                      prompt_audio_path: str, instruct_text: str,
-                                      output_path: str, speed: float, stream: bool) -> float:
-        """Instruct synthesis with prompt audio"""
-        import time
-        start_time = time.time()
-
-        def _sync_synthesis():
-            # Load and postprocess prompt audio like in original webui
-            prompt_speech_16k = postprocess(load_wav(prompt_audio_path, PROMPT_SR), model.sample_rate)
-
-            # Set random seed for reproducible results
-            set_all_random_seed(42)
-
-            # Repo gốc CosyVoice: inference_cross_lingual chỉ cần text (không cần language tags)
-            # Model tự detect language từ text content
-
-            if hasattr(model, 'inference_cross_lingual'):
-                # EXACT match với repo gốc: inference_cross_lingual(tts_text, prompt_speech_16k, stream, speed)
-                logger.info(f"Using cross-lingual mode (exact match với repo gốc): text='{text}'")
-                if instruct_text:
-                    logger.info(f"Note: instruct_text ignored in cross-lingual mode (như repo gốc): '{instruct_text[:50]}...'")
-                if prompt_text:
-                    logger.info(f"Note: prompt_text ignored in cross-lingual mode (như repo gốc): '{prompt_text[:50]}...'")
-
-                # EXACT signature như repo gốc: inference_cross_lingual(tts_text, prompt_speech_16k, stream, speed)
-                synthesis_generator = model.inference_cross_lingual(
-                    text, prompt_speech_16k, stream=stream, speed=speed
-                )
-            else:
-                # Fallback to zero-shot if cross_lingual not available
-                logger.info(f"Cross-lingual not available, using zero-shot fallback: text='{text}'")
-                synthesis_generator = model.inference_zero_shot(
-                    text, "", prompt_speech_16k, stream=stream, speed=speed
+                if stop.is_set():
+                    return
+                speech = model_output['tts_speech'].reshape(-1)
+                pcm = (speech.clamp(-1.0, 1.0) * 32767).to(torch.int16).numpy().tobytes()
+                loop.call_soon_threadsafe(chunks.put_nowait, pcm)
+                samples += speech.numel()
+                chunk_count += 1
+                if chunk_count >= max_chunks or samples > max_samples:
+                    logger.warning("🛑 Stopping streamed generation after %d chunks, %d samples", chunk_count, samples)
+                    return
+
+        producer = asyncio.ensure_future(self._run_on_gpu(_produce))
+        # Runs after every chunk the thread queued, since they were scheduled first
+        producer.add_done_callback(lambda _: chunks.put_nowait(None))
+        try:
+            yield wav_stream_header(model.sample_rate)
+            while (pcm := await chunks.get()) is not None:
+                yield pcm
+            await producer
+        finally:
+            stop.set()
+
+    async def synthesize_cross_lingual_batch(
+        self, requests: List[CrossLingualWithCacheRequest]
+    ) -> List[Union[SynthesisResponse, Exception]]:
+        """
+        Synthesize a batch of cached-voice requests.
+        Requests for the same voice share one prompt feature extraction. CosyVoice's tts()
+        is single-utterance, so the model itself still runs once per request, but the
+        requests are submitted together: the synthesis threads keep the model busy
+        while the others' host-side work (feature lookup, text normalization) overlaps it.
+        Returns one SynthesisResponse or exception per request, in order.
+        """
+        results: List[Union[SynthesisResponse, Exception]] = [None] * len(requests)
+        model = self.voice_manager.get_model_directly()
+
+        by_voice: Dict[str, List[int]] = {}
+        for index, request in enumerate(requests):
+            by_voice.setdefault(request.voice_id, []).append(index)
+
+        async def _synthesize_voice_group(voice_id: str, indices: List[int]):
+            try:
+                if not model:
+                    raise ModelNotReadyError("CosyVoice model not ready")
+                prompt_features = await self._get_cached_voice_features(model, voice_id)
+            except Exception as e:
+                for index in indices:
+                    results[index] = SynthesisError(f"Cross-lingual synthesis failed: {str(e)}")
+                return
+
+            outcomes = await asyncio.gather(
+                *(self.synthesize_cross_lingual_with_cache(requests[index], prompt_features=prompt_features)
+                  for index in indices),
+                return_exceptions=True
+            )
+            for index, outcome in zip(indices, outcomes):
+                results[index] = outcome
+
+        await asyncio.gather(*(_synthesize_voice_group(voice_id, indices) for voice_id, indices in by_voice.items()))
+        return results
+
+    async def _get_prompt_features(self, model, prompt_audio_url: str,
+                                   prompt_key: Optional[str] = None,
+                                   prompt_speech_16k: Optional[torch.Tensor] = None) -> Dict[str, Any]:
+        """Get prompt features from the embedding cache, extracting them from the audio on a miss"""
+        embedding_cache = self.voice_manager.embedding_cache
+        if prompt_key:
+            prompt_features = await embedding_cache.get(prompt_key)
+            if prompt_features is not None:
+                logger.debug("Prompt embedding cache hit: %.16s", prompt_key)
+                return prompt_features
+
+            extracting = self._extracting.get(prompt_key)
+            if extracting is None:
+                extracting = asyncio.create_task(
+                    self._extract_and_cache(model, prompt_audio_url, prompt_key, prompt_speech_16k)
                 )
+                self._extracting[prompt_key] = extracting
+                extracting.add_done_callback(lambda _: self._extracting.pop(prompt_key, None))
+            # Shielded so that a cancelled request does not cancel the extraction others wait on
+            return await asyncio.shield(extracting)
+
+        return await self._extract_prompt_features(model, prompt_audio_url, prompt_speech_16k)
+
+    async def _extract_and_cache(self, model, prompt_audio_url: str, prompt_key: str,
+                                 prompt_speech_16k: Optional[torch.Tensor] = None) -> Dict[str, Any]:
+        """Extract prompt features and store them in the embedding cache under prompt_key"""
+        prompt_features = await self._extract_prompt_features(model, prompt_audio_url, prompt_speech_16k)
+        await self.voice_manager.embedding_cache.put(prompt_key, prompt_features)
+        return prompt_features
+
+    async def _extract_prompt_features(self, model, prompt_audio_url: str,
+                                       prompt_speech_16k: Optional[torch.Tensor] = None) -> Dict[str, Any]:
+        """Run the frontend over prompt speech, loading it from prompt_audio_url if not given"""
+        if prompt_speech_16k is None:
+            prompt_audio_path = await self._resolve_audio_path(prompt_audio_url)
+            if not await aiofiles.os.path.exists(prompt_audio_path):
+                raise FileNotFoundError(f"Prompt audio file not found: {prompt_audio_path}")
 
-            # Process audio chunks EXACTLY like webui.py gốc - NO CONCATENATION!
-            # Webui.py yields each chunk separately, we collect them properly
-            all_audio_data = []
-            chunk_count = 0
-
-            for model_output in synthesis_generator:
-                if 'tts_speech' in model_output:
-                    # EXACT như webui.py: flatten audio chunk
-                    audio_chunk = model_output['tts_speech'].numpy().flatten()
-                    all_audio_data.extend(audio_chunk)  # Extend, not append!
-                    chunk_count += 1
-                    logger.info(f"📊 Processed chunk {chunk_count}: {len(audio_chunk)} samples")
-
-            if not all_audio_data:
-                raise SynthesisError("No audio generated")
-
-            # Convert to tensor - EXACT như webui.py output
-            final_audio = torch.tensor(all_audio_data, dtype=torch.float32).unsqueeze(0)
-            logger.info(f"✅ Final audio shape: {final_audio.shape}, chunks: {chunk_count}")
-
-            # Save audio to file - EXACT sample rate như webui.py
-            torchaudio.save(output_path, final_audio.cpu(), model.sample_rate)
-
-            return time.time() - start_time
-
-        # Run synthesis in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _sync_synthesis)
-
-    async def _synthesize_with_cached_voice_instruct(self, model, text: str, voice_id: str,
-                                                   instruct_text: str, output_path: str,
-                                                   speed: float, stream: bool) -> float:
-        """Instruct synthesis with cached voice"""
-        import time
-        start_time = time.time()
-
+        @torch.inference_mode()
+        def _extract():
+            # Load and postprocess prompt audio like in original webui
+            speech_16k = prompt_speech_16k if prompt_speech_16k is not None else load_wav(prompt_audio_path, PROMPT_SR)
+            return extract_prompt_features(model, postprocess(speech_16k, model.sample_rate))
+
+        return await self._run_on_gpu(_extract)
+
+    async def preload_cached_voices(self, voice_ids: Optional[List[str]] = None):
+        """
+        Extract cached voices' prompt features into the embedding cache ahead of their first request
+        Without voice_ids, the most recently updated voices are loaded, up to the embedding cache capacity
+        """
+        model = self.voice_manager.get_model_directly()
+        if not model:
+            return
+        if voice_ids is None:
+            voices = sorted(self.voice_manager.voice_cache.voices.values(), key=lambda v: v.updated_at, reverse=True)
+            voice_ids = [voice.voice_id for voice in voices[:self.voice_manager.embedding_cache.capacity]]
+
+        loaded = 0
+        for voice_id in voice_ids:
+            try:
+                await self._get_cached_voice_features(model, voice_id)
+                loaded += 1
+            except Exception as e:
+                logger.warning("Could not preload prompt features of voice %s: %s", voice_id, e)
+        logger.info("Preloaded prompt features of %d cached voices", loaded)
+
+    async def warmup(self):
+        """
+        Synthesize a short utterance with the most recently updated cached voice, so compiled
+        modules trace and capture their graphs at startup rather than during the first request
+        """
+        model = self.voice_manager.get_model_directly()
+        voices = sorted(self.voice_manager.voice_cache.voices.values(), key=lambda v: v.updated_at, reverse=True)
+        if not model or not voices:
+            logger.info("No cached voice to warm up compiled inference with")
+            return
+
+        output_path = file_manager.get_output_audio_path(f"warmup_{os.urandom(4).hex()}.wav")
+        try:
+            prompt_features = await self._get_cached_voice_features(model, voices[0].voice_id)
+            synthesis_time, _ = await self._run_inference(
+                model, "Warmup.", prompt_features, output_path, speed=1.0, stream=False
+            )
+            logger.info("Warmed up compiled inference in %.1fs", synthesis_time)
+        except Exception as e:
+            logger.warning("Inference warmup failed: %s", e)
+        finally:
+            file_manager.delete_file(output_path)
+
+    async def _run_inference(self, model, text: str, prompt_features: Dict[str, Any], output_path: str,
+                             speed: float, stream: bool, prompt_text: Optional[str] = None,
+                             max_chunks: Optional[int] = None, max_samples: Optional[int] = None) -> Tuple[float, float]:
+        """
+        Synthesize text with precomputed prompt features, streaming the audio to output_path
+        prompt_text selects zero-shot mode, None cross-lingual mode; max_chunks/max_samples cap generation
+        Returns: (synthesis time, audio duration) in seconds; the duration comes from the samples written,
+        so the output file is not opened again to measure it
+        """
+        start_time = time.perf_counter()
+
+        # Grad mode is per thread: the vocoder and frontend run here outside CosyVoice's own
+        # inference_mode-decorated LLM and flow, so turn autograd off for the whole pass
+        @torch.inference_mode()
         def _sync_synthesis():
-            # Get cached voice audio path
-            voice = self.voice_manager.voice_cache.voices.get(voice_id)
-            if not voice or not voice.audio_file_path:
-                raise VoiceNotFoundError(f"Cached voice '{voice_id}' audio not found")
-
-            # Load and postprocess cached voice audio
-            prompt_speech_16k = postprocess(load_wav(voice.audio_file_path, PROMPT_SR))
-
             # Set random seed for reproducible results
             set_all_random_seed(42)
 
-            # Use instruct inference with cached voice
-            if hasattr(model, 'instruct') and model.instruct:
-                synthesis_generator = model.inference_instruct(
-                    text, voice_id, instruct_text, stream=stream, speed=speed
-                )
-            else:
-                # Fallback to zero-shot with instruct as prompt text
-                synthesis_generator = model.inference_zero_shot(
-                    text, instruct_text, prompt_speech_16k, stream=stream, speed=speed
-                )
-
-            # Collect audio chunks
-            audio_chunks = []
-            for model_output in synthesis_generator:
-                if 'tts_speech' in model_output:
-                    audio_chunks.append(model_output['tts_speech'])
-
-            if not audio_chunks:
-                raise SynthesisError("No audio generated")
-
-            # Concatenate audio chunks
-            final_audio = torch.cat(audio_chunks, dim=1)
-
-            # Save audio
-            torchaudio.save(output_path, final_audio, model.sample_rate)
+            synthesis_generator = inference_with_prompt_features(
+                model, text, prompt_features, prompt_text=prompt_text, stream=stream, speed=speed
+            )
+            samples, chunk_count = write_speech(
+                synthesis_generator, output_path, model.sample_rate,
+                max_chunks=max_chunks, max_samples=max_samples
+            )
+            duration = samples / model.sample_rate
+            logger.info("✅ Final audio: %d samples, chunks: %d, duration: %.2fs", samples, chunk_count, duration)
 
-            return time.time() - start_time
+            return time.perf_counter() - start_time, duration
 
-        # Run synthesis in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _sync_synthesis)
+        # Run synthesis on the synthesis threads to avoid blocking
+        return await self._run_on_gpu(_sync_synthesis)
 
     async def _resolve_audio_path(self, audio_url: str) -> str:
         """Resolve audio URL to local file path"""
-        # If it's already a local path, return as is
-        if os.path.exists(audio_url):
+        # If it's already a local path, return as is (stat runs off the event loop)
+        if await aiofiles.os.path.exists(audio_url):
             return audio_url
 
         # If it's a URL starting with /api/v1/audio/, resolve to local path
@@ -372,260 +552,14 @@ class SynthesisEngine:
 
         return audio_url
 
-    async def _synthesize_with_cached_voice(self, model, text: str, voice_id: str,
-                                          output_path: str, speed: float, stream: bool, prompt_text: str = None) -> float:
-        """Synthesize with cached voice using SFT method"""
-        import time
-        start_time = time.time()
-
-        def _sync_synthesis():
-            # Set random seed for reproducible results
-            set_all_random_seed(42)
-
-            # Check if voice is in spk2info (loaded cached voices)
-            if hasattr(model, 'frontend') and voice_id in model.frontend.spk2info:
-                # Use SFT synthesis with cached voice (no text_frontend parameter)
-                synthesis_generator = model.inference_sft(text, voice_id, stream=stream, speed=speed)
-            else:
-                # Get cached voice audio for zero-shot
-                voice = self.voice_manager.voice_cache.voices.get(voice_id)
-                if voice and voice.audio_file_path:
-                    prompt_speech_16k = postprocess(load_wav(voice.audio_file_path, PROMPT_SR))
-                    # Use provided prompt_text or fallback to cached voice prompt_text
-                    used_prompt_text = prompt_text if prompt_text else (voice.prompt_text or "")
-                    synthesis_generator = model.inference_zero_shot(
-                        text, used_prompt_text, prompt_speech_16k, stream=stream, speed=speed
-                    )
-                else:
-                    raise VoiceNotFoundError(f"Cached voice '{voice_id}' not found")
-
-            # Collect audio chunks
-            audio_chunks = []
-            for model_output in synthesis_generator:
-                if 'tts_speech' in model_output:
-                    audio_chunks.append(model_output['tts_speech'])
-
-            if not audio_chunks:
-                raise SynthesisError("No audio generated")
-
-            # Concatenate audio chunks
-            final_audio = torch.cat(audio_chunks, dim=1)
-
-            # Save audio
-            torchaudio.save(output_path, final_audio, model.sample_rate)
-
-            return time.time() - start_time
-
-        # Run synthesis in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _sync_synthesis)
-
-    async def _synthesize_with_prompt_audio(self, model, text: str, prompt_text: str,
-                                          prompt_audio: bytes, output_path: str,
-                                          speed: float, stream: bool) -> float:
-        """Synthesize with prompt audio"""
-        import time
-        start_time = time.time()
-
-        # Save prompt audio to temp file
-        temp_audio_path = await file_manager.save_temp_file(prompt_audio, "prompt.wav")
-
-        try:
-            # Load prompt audio
-            from cosyvoice.utils.file_utils import load_wav
-            loop = asyncio.get_event_loop()
-            prompt_speech_16k = await loop.run_in_executor(
-                None, load_wav, temp_audio_path, 16000
-            )
-
-            # Perform zero-shot synthesis
-            synthesis_generator = await loop.run_in_executor(
-                None, lambda: model.inference_zero_shot(
-                    text, prompt_text, prompt_speech_16k, stream=stream, speed=speed
-                )
-            )
-
-            # Collect and save audio
-            audio_chunks = []
-            for model_output in synthesis_generator:
-                if 'tts_speech' in model_output:
-                    audio_chunks.append(model_output['tts_speech'])
-
-            if not audio_chunks:
-                raise SynthesisError("No audio generated")
-
-            final_audio = torch.cat(audio_chunks, dim=1)
-            torchaudio.save(output_path, final_audio, model.sample_rate)
-
-            return time.time() - start_time
-
-        finally:
-            # Clean up temp file
-            file_manager.delete_file(temp_audio_path)
-
-    async def _synthesize_cross_lingual_cached(self, model, text: str, voice_id: str,
-                                             output_path: str, speed: float, stream: bool) -> float:
-        """Cross-lingual synthesis with cached voice - sử dụng inference_cross_lingual như repo gốc"""
-        import time
-        start_time = time.time()
-
-        def _sync_synthesis():
-            # Set random seed for reproducible results
-            set_all_random_seed(42)
-
-            # Get cached voice - ALWAYS use cross-lingual (跨语种复刻) as requested
-            voice = self.voice_manager.voice_cache.voices.get(voice_id)
-            if voice and voice.audio_file_path:
-                prompt_speech_16k = postprocess(load_wav(voice.audio_file_path, PROMPT_SR), model.sample_rate)
-
-                # ALWAYS use cross-lingual method as requested - no exceptions
-                logger.info(f"🎯 USING CROSS-LINGUAL MODE (跨语种复刻) for voice '{voice_id}': text='{text}'")
-
-                # Check for Japanese and add special handling to prevent hallucination
-                import re
-                is_japanese = bool(re.search(r'[\u3040-\u309f\u30a0-\u30ff]', text))
-
-                if is_japanese:
-                    logger.info(f"🇯🇵 Japanese detected - applying anti-hallucination measures")
-                    # For Japanese, we might need to limit generation or add special parameters
-                    # But still use cross-lingual as requested
-
-                if hasattr(model, 'inference_cross_lingual'):
-                    logger.info(f"🔧 Method: model.inference_cross_lingual(text='{text}', prompt_speech_16k, stream={stream}, speed={speed})")
-                    synthesis_generator = model.inference_cross_lingual(
-                        text, prompt_speech_16k, stream=stream, speed=speed
-                    )
-                    logger.info(f"✅ Cross-lingual synthesis generator created successfully")
-                else:
-                    # Fallback to zero-shot if cross_lingual not available
-                    logger.info(f"❌ Cross-lingual not available, using zero-shot fallback for cached voice '{voice_id}'")
-                    synthesis_generator = model.inference_zero_shot(
-                        text, "", prompt_speech_16k, stream=stream, speed=speed
-                    )
-            else:
-                raise VoiceNotFoundError(f"Cached voice '{voice_id}' not found")
-
-            # Process audio chunks with anti-hallucination for Japanese
-            all_audio_data = []
-            chunk_count = 0
-            max_chunks = 100 if is_japanese else 200  # Increase Japanese limit
-            expected_duration = len(text) * 0.15 / speed  # CRITICAL FIX: Adjust for speed!
-            max_samples = int(model.sample_rate * expected_duration * 5)  # Max 5x expected duration (increased)
-
-            logger.debug(f"🎯 Generation limits: max_chunks={max_chunks}, max_samples={max_samples}")
-
-            for model_output in synthesis_generator:
-                if 'tts_speech' in model_output:
-                    # EXACT như webui.py: flatten audio chunk
-                    audio_chunk = model_output['tts_speech'].numpy().flatten()
-
-                    # ADD CHUNK FIRST, then check limits
-                    all_audio_data.extend(audio_chunk)  # Extend, not append!
-                    chunk_count += 1
-                    logger.debug(f"📊 Processed chunk {chunk_count}: {len(audio_chunk)} samples, total: {len(all_audio_data)}")
-
-                    # Anti-hallucination: Stop AFTER adding chunk if limits reached
-                    if chunk_count >= max_chunks:
-                        logger.warning(f"🛑 Stopping generation: reached max chunks ({max_chunks}) - but keeping current audio")
-                        break
-
-                    if len(all_audio_data) > max_samples:
-                        logger.warning(f"🛑 Stopping generation: exceeded max samples ({max_samples}) - but keeping current audio")
-                        break
-
-            if not all_audio_data:
-                raise SynthesisError("No audio generated")
-
-            # Convert to tensor - EXACT như webui.py output
-            final_audio = torch.tensor(all_audio_data, dtype=torch.float32).unsqueeze(0)
-            actual_duration = len(all_audio_data) / model.sample_rate
-            logger.info(f"✅ Final audio: {final_audio.shape}, chunks: {chunk_count}, duration: {actual_duration:.2f}s")
-
-            # Save audio to file - EXACT sample rate như webui.py
-            torchaudio.save(output_path, final_audio.cpu(), model.sample_rate)
-
-            return time.time() - start_time
-
-        # Run synthesis in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _sync_synthesis)
-
-    async def _synthesize_cross_lingual_prompt(self, model, text: str, prompt_audio: bytes,
-                                             output_path: str, speed: float, stream: bool) -> float:
-        """Cross-lingual synthesis with prompt audio"""
-        import time
-        start_time = time.time()
-
-        # Save prompt audio to temp file
-        temp_audio_path = await file_manager.save_temp_file(prompt_audio, "prompt.wav")
-
-        try:
-            # Load prompt audio
-            from cosyvoice.utils.file_utils import load_wav
-            loop = asyncio.get_event_loop()
-            prompt_speech_16k = await loop.run_in_executor(
-                None, load_wav, temp_audio_path, 16000
-            )
-
-            # Perform cross-lingual synthesis (no prompt text needed)
-            synthesis_generator = await loop.run_in_executor(
-                None, lambda: model.inference_zero_shot(
-                    text, "", prompt_speech_16k, stream=stream, speed=speed
-                )
-            )
-
-            # Collect and save audio
-            audio_chunks = []
-            for model_output in synthesis_generator:
-                if 'tts_speech' in model_output:
-                    audio_chunks.append(model_output['tts_speech'])
-
-            if not audio_chunks:
-                raise SynthesisError("No audio generated")
-
-            final_audio = torch.cat(audio_chunks, dim=1)
-            torchaudio.save(output_path, final_audio, model.sample_rate)
-
-            return time.time() - start_time
-
-        finally:
-            # Clean up temp file
-            file_manager.delete_file(temp_audio_path)
-
-    async def _synthesize_instruct_mode(self, model, text: str, voice_id: str,
-                                      instruct_text: str, output_path: str,
-                                      speed: float, stream: bool) -> float:
-        """Instruct mode synthesis"""
-        import time
-        start_time = time.time()
-
-        loop = asyncio.get_event_loop()
-
-        # Perform instruct synthesis
-        synthesis_generator = await loop.run_in_executor(
-            None, lambda: model.inference_instruct(
-                text, voice_id, instruct_text, stream=stream, speed=speed
-            )
-        )
-
-        # Collect and save audio
-        audio_chunks = []
-        for model_output in synthesis_generator:
-            if 'tts_speech' in model_output:
-                audio_chunks.append(model_output['tts_speech'])
-
-        if not audio_chunks:
-            raise SynthesisError("No audio generated")
-
-        final_audio = torch.cat(audio_chunks, dim=1)
-        torchaudio.save(output_path, final_audio, model.sample_rate)
-
-        return time.time() - start_time
-
-    async def _get_audio_duration(self, audio_path: str) -> Optional[float]:
-        """Get audio file duration"""
-        try:
-            audio_info = await audio_processor._get_audio_info(audio_path)
-            return audio_info[0] if audio_info else None
-        except Exception:
-            return None
+    async def _get_cached_voice_features(self, model, voice_id: str) -> Dict[str, Any]:
+        """
+        Prompt features of a cached voice's reference audio
+        Kept in the embedding cache under the voice's id, so a hot voice is decoded, resampled and
+        run through the frontend once rather than on every request, and a hit needs no file access
+        """
+        voice = self.voice_manager.voice_cache.voices.get(voice_id)
+        if not voice or not voice.audio_file_path:
+            raise VoiceNotFoundError(f"Cached voice '{voice_id}' not found")
+        prompt_key = voice_features_key(voice)
+        return await self._get_prompt_features(model, voice.audio_file_path, prompt_key=prompt_key)
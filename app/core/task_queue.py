@@ -0,0 +1,62 @@
+"""
+Celery task queue for task-based synthesis
+Only used when TASK_BROKER_URL is set. Start GPU workers with:
+    celery -A app.core.task_queue worker -Q gpu_synth --concurrency 1
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict
+
+from celery import Celery
+from celery.signals import worker_process_init
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Queue consumed by GPU workers
+TASK_QUEUE = "gpu_synth"
+
+celery_app = Celery("cosyvoice2_api", broker=settings.TASK_BROKER_URL)
+celery_app.conf.update(
+    task_default_queue=TASK_QUEUE,
+    # Long synthesis tasks: take one at a time, ack after completion so a crashed worker's task is redelivered
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    # Task state lives in the Redis task store, not in a Celery result backend
+    task_ignore_result=True,
+)
+
+# Per worker process: event loop, synthesis engine and task store
+_worker_loop: asyncio.AbstractEventLoop = None
+_worker_engine = None
+_worker_store = None
+
+
+@worker_process_init.connect
+def _init_worker(**kwargs):
+    """Load the model once per worker process"""
+    global _worker_loop, _worker_engine, _worker_store
+    from app.core.voice_manager import VoiceManager
+    from app.core.synthesis_engine import SynthesisEngine
+    from app.core.task_store import RedisTaskStore
+
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+
+    voice_manager = VoiceManager(model_dir=settings.MODEL_DIR, cache_dir=settings.VOICE_CACHE_DIR)
+    _worker_loop.run_until_complete(voice_manager.initialize())
+    _worker_engine = SynthesisEngine(voice_manager)
+    _worker_store = RedisTaskStore(settings.TASK_BROKER_URL, ttl=settings.TASK_TTL)
+    logger.info("Synthesis worker ready")
+
+
+@celery_app.task(name="synthesize_task")
+def synthesize_task(task_id: str, request: Dict[str, Any]):
+    """Run a registered synthesis task on this worker"""
+    from app.api.v1.tasks import TaskRequest, process_task_background
+
+    _worker_loop.run_until_complete(
+        process_task_background(task_id, TaskRequest(**request), _worker_engine, _worker_store)
+    )
@@ -0,0 +1,290 @@
+"""
+Task state storage for task-based synthesis
+In-process dict by default; Redis hashes when TASK_BROKER_URL is set so task
+state is shared by every API and GPU worker process and survives restarts
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Redis key of a task's hash, and of the index of all task ids scored by creation time
+TASK_KEY = "task:{}".format
+TASK_INDEX_KEY = "tasks"
+# Redis key marking that a content hash's synthesized file is on disk; expires after the task TTL
+COMPLETED_KEY = "tasks:completed:{}".format
+# Redis set of the ids of tasks pointing at a content hash's result file
+REFS_KEY = "tasks:refs:{}".format
+
+# Task statuses after which a task record only waits to be reaped
+FINISHED_STATUSES = frozenset({"completed", "failed"})
+
+# Update an existing task hash atomically - never recreating one deleted or expired meanwhile.
+# ARGV[1] is the TTL to set (0 for none), the rest field/value pairs; returns the task's raw
+# content_hash when a TTL was set, for its reference set to be kept alive as long
+UPDATE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return false
+end
+redis.call('hset', KEYS[1], unpack(ARGV, 2))
+if ARGV[1] ~= '0' then
+    redis.call('expire', KEYS[1], ARGV[1])
+    return redis.call('hget', KEYS[1], 'content_hash')
+end
+return false
+"""
+
+
+class MemoryTaskStore:
+    """
+    Task state and completed-result markers kept in this process, bounded by a TTL reaper and an LRU size cap
+    tasks_lock only guards inserting and removing task records; reads and field
+    updates of an existing record never await, so they are atomic on the event loop
+    and status polls do not queue behind writers
+    """
+
+    def __init__(self, ttl: float = 3600, max_size: int = 10000, reap_interval: float = 60):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.reap_interval = reap_interval
+        self.tasks_storage: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.tasks_lock = asyncio.Lock()
+        # content hash -> (monotonic time its result was recorded, result fields), oldest first
+        self.completed_results: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # content hash -> ids of kept tasks pointing at its result file
+        self._refs: Dict[str, Set[str]] = {}
+        # task_id -> monotonic time the task finished
+        self._finished_at: Dict[str, float] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start reaping finished tasks older than the TTL"""
+        self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def stop(self):
+        """Stop the reaper"""
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            deadline = time.monotonic() - self.ttl
+            async with self.tasks_lock:
+                expired = [task_id for task_id, finished_at in self._finished_at.items() if finished_at < deadline]
+                for task_id in expired:
+                    self._drop(task_id)
+            # Completed-result markers expire like the tasks that recorded them
+            while self.completed_results and next(iter(self.completed_results.values()))[0] < deadline:
+                self.completed_results.popitem(last=False)
+            if expired:
+                logger.info("Reaped %d finished tasks", len(expired))
+
+    def _drop(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Remove a task record and its reference to its content hash; caller holds tasks_lock"""
+        self._finished_at.pop(task_id, None)
+        task = self.tasks_storage.pop(task_id, None)
+        if task is not None and "content_hash" in task:
+            refs = self._refs.get(task["content_hash"])
+            if refs is not None:
+                refs.discard(task_id)
+                if not refs:
+                    del self._refs[task["content_hash"]]
+        return task
+
+    def _eviction_candidate(self, task_id: str) -> str:
+        """
+        Record to evict to make room for task_id: the longest finished one, or, only if no other
+        record has finished, the least recently updated unfinished one
+        """
+        for candidates in (self._finished_at, self.tasks_storage):
+            for candidate in candidates:
+                if candidate != task_id:
+                    return candidate
+        return task_id
+
+    async def create(self, task_id: str, task_data: Dict[str, Any]):
+        """Register a new task, evicting records beyond max_size (finished ones first)"""
+        async with self.tasks_lock:
+            self.tasks_storage[task_id] = task_data
+            if "content_hash" in task_data:
+                self._refs.setdefault(task_data["content_hash"], set()).add(task_id)
+            if task_data.get("status") in FINISHED_STATUSES:
+                self._finished_at[task_id] = time.monotonic()
+            while len(self.tasks_storage) > self.max_size:
+                self._drop(self._eviction_candidate(task_id))
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get a task's data, or None if it does not exist"""
+        return self.tasks_storage.get(task_id)
+
+    async def update(self, task_id: str, fields: Dict[str, Any]):
+        """Update fields of an existing task; unknown task ids are ignored"""
+        task = self.tasks_storage.get(task_id)
+        if task is not None:
+            task.update(fields)
+            self.tasks_storage.move_to_end(task_id)
+            if fields.get("status") in FINISHED_STATUSES:
+                self._finished_at[task_id] = time.monotonic()
+
+    async def list(self) -> List[Dict[str, Any]]:
+        """All tasks"""
+        return list(self.tasks_storage.values())
+
+    async def delete(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Remove a task, returning its data or None if it did not exist"""
+        async with self.tasks_lock:
+            return self._drop(task_id)
+
+    async def content_refs(self, content_hash: str) -> int:
+        """Number of kept tasks pointing at the result file of a content hash"""
+        return len(self._refs.get(content_hash, ()))
+
+    async def add_completed(self, content_hash: str, duration: Optional[float]):
+        """Record that the result for a content hash is on disk, forgetting the oldest beyond max_size"""
+        self.completed_results[content_hash] = (time.monotonic(), {"duration": duration})
+        self.completed_results.move_to_end(content_hash)
+        while len(self.completed_results) > self.max_size:
+            self.completed_results.popitem(last=False)
+
+    async def is_completed(self, content_hash: str) -> bool:
+        """Whether the result for a content hash is on disk"""
+        return content_hash in self.completed_results
+
+    async def get_completed(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Fields recorded with the result for a content hash, or None if it is not on disk"""
+        completed = self.completed_results.get(content_hash)
+        return completed[1] if completed is not None else None
+
+    async def discard_completed(self, content_hash: str):
+        """Forget a completed result, e.g. after its file was deleted"""
+        self.completed_results.pop(content_hash, None)
+
+
+class RedisTaskStore:
+    """
+    Task state kept in Redis: one hash per task, field values JSON-encoded
+    Finished task records expire ttl seconds after finishing, Redis doing what MemoryTaskStore's
+    reaper does; index entries of expired records are pruned when tasks are listed
+    """
+
+    def __init__(self, url: str, ttl: float = 3600):
+        import redis.asyncio as aioredis
+        self.redis = aioredis.from_url(url)
+        self.ttl = int(ttl)
+        self._update = self.redis.register_script(UPDATE_SCRIPT)
+
+    def start(self):
+        """Nothing to reap in-process; task records live in Redis"""
+
+    async def stop(self):
+        """Close the Redis connection pool"""
+        await self.redis.aclose()
+
+    @staticmethod
+    def _decode(raw: Dict[bytes, bytes]) -> Optional[Dict[str, Any]]:
+        if not raw:
+            return None
+        return {key.decode(): orjson.loads(value) for key, value in raw.items()}
+
+    async def create(self, task_id: str, task_data: Dict[str, Any]):
+        """Register a new task"""
+        mapping = {key: orjson.dumps(value) for key, value in task_data.items()}
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(TASK_KEY(task_id), mapping=mapping)
+            pipe.zadd(TASK_INDEX_KEY, {task_id: time.time()})
+            if task_data.get("status") in FINISHED_STATUSES:
+                pipe.expire(TASK_KEY(task_id), self.ttl)
+            if "content_hash" in task_data:
+                pipe.sadd(REFS_KEY(task_data["content_hash"]), task_id)
+                pipe.expire(REFS_KEY(task_data["content_hash"]), self.ttl)
+            await pipe.execute()
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get a task's data, or None if it does not exist"""
+        return self._decode(await self.redis.hgetall(TASK_KEY(task_id)))
+
+    async def update(self, task_id: str, fields: Dict[str, Any]):
+        """Update fields of an existing task; unknown task ids are ignored"""
+        ttl = self.ttl if fields.get("status") in FINISHED_STATUSES else 0
+        args = [ttl]
+        for field, value in fields.items():
+            args += [field, orjson.dumps(value)]
+        content_hash = await self._update(keys=[TASK_KEY(task_id)], args=args)
+        if content_hash is not None:
+            # The reference set outlives every record it lists
+            await self.redis.expire(REFS_KEY(orjson.loads(content_hash)), self.ttl)
+
+    async def list(self) -> List[Dict[str, Any]]:
+        """All tasks"""
+        task_ids = await self.redis.zrange(TASK_INDEX_KEY, 0, -1)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                pipe.hgetall(TASK_KEY(task_id.decode()))
+            results = await pipe.execute()
+        # Drop index entries whose record expired, so the index does not keep growing
+        expired = [task_id for task_id, raw in zip(task_ids, results) if not raw]
+        if expired:
+            await self.redis.zrem(TASK_INDEX_KEY, *expired)
+        return [task for task in map(self._decode, results) if task is not None]
+
+    async def delete(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Remove a task, returning its data or None if it did not exist"""
+        key = TASK_KEY(task_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(key)
+            pipe.delete(key)
+            pipe.zrem(TASK_INDEX_KEY, task_id)
+            raw, _, _ = await pipe.execute()
+        task = self._decode(raw)
+        if task is not None and "content_hash" in task:
+            await self.redis.srem(REFS_KEY(task["content_hash"]), task_id)
+        return task
+
+    async def content_refs(self, content_hash: str) -> int:
+        """Number of kept tasks pointing at the result file of a content hash"""
+        refs_key = REFS_KEY(content_hash)
+        task_ids = [task_id.decode() for task_id in await self.redis.smembers(refs_key)]
+        if not task_ids:
+            return 0
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                pipe.exists(TASK_KEY(task_id))
+            alive = await pipe.execute()
+        # Forget tasks whose record is gone without a delete (e.g. expired)
+        gone = [task_id for task_id, exists in zip(task_ids, alive) if not exists]
+        if gone:
+            await self.redis.srem(refs_key, *gone)
+        return len(task_ids) - len(gone)
+
+    async def add_completed(self, content_hash: str, duration: Optional[float]):
+        """Record that the result for a content hash is on disk"""
+        await self.redis.set(COMPLETED_KEY(content_hash), orjson.dumps({"duration": duration}), ex=self.ttl)
+
+    async def is_completed(self, content_hash: str) -> bool:
+        """Whether the result for a content hash is on disk"""
+        return bool(await self.redis.exists(COMPLETED_KEY(content_hash)))
+
+    async def get_completed(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Fields recorded with the result for a content hash, or None if it is not on disk"""
+        raw = await self.redis.get(COMPLETED_KEY(content_hash))
+        return orjson.loads(raw) if raw is not None else None
+
+    async def discard_completed(self, content_hash: str):
+        """Forget a completed result, e.g. after its file was deleted"""
+        await self.redis.delete(COMPLETED_KEY(content_hash))
+
+
+def create_task_store(broker_url: Optional[str], ttl: float = 3600, max_size: int = 10000):
+    """Redis-backed store when a broker URL is configured, in-process otherwise"""
+    if broker_url:
+        logger.info("Using Redis task store")
+        return RedisTaskStore(broker_url, ttl=ttl)
+    return MemoryTaskStore(ttl=ttl, max_size=max_size)
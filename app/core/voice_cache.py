@@ -6,7 +6,7 @@ import json
 import os
 import asyncio
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set
 from pathlib import Path
 
 # Path setup should be handled by main.py - keep this simple
@@ -22,6 +22,11 @@ class VoiceCache:
         self.db_file = Path(db_file)
         self.voices: Dict[str, VoiceInDB] = {}
         self._lock = asyncio.Lock()
+        # Secondary indexes for list_voices filters, and the full listing order (rebuilt lazily)
+        self._by_type: Dict[VoiceType, Set[str]] = {}
+        self._by_language: Dict[str, Set[str]] = {}
+        self._by_audio_hash: Dict[str, Set[str]] = {}
+        self._sorted_ids: Optional[List[str]] = None
         
         # Ensure directories exist
         self.cache_dir.mkdir(parents=True, exist_ok=True)
@@ -31,6 +36,32 @@ class VoiceCache:
         """Initialize the voice cache by loading from disk"""
         async with self._lock:
             await self._load_from_disk()
+            self._by_type = {}
+            self._by_language = {}
+            self._by_audio_hash = {}
+            for voice in self.voices.values():
+                self._index(voice)
+    
+    def _index(self, voice: VoiceInDB):
+        """Add a voice to the filter indexes"""
+        self._by_type.setdefault(voice.voice_type, set()).add(voice.voice_id)
+        if voice.language:
+            self._by_language.setdefault(voice.language, set()).add(voice.voice_id)
+        if voice.audio_hash:
+            self._by_audio_hash.setdefault(voice.audio_hash, set()).add(voice.voice_id)
+        self._sorted_ids = None
+    
+    def _unindex(self, voice: VoiceInDB):
+        """Remove a voice from the filter indexes"""
+        self._by_type.get(voice.voice_type, set()).discard(voice.voice_id)
+        if voice.language:
+            self._by_language.get(voice.language, set()).discard(voice.voice_id)
+        if voice.audio_hash:
+            self._by_audio_hash.get(voice.audio_hash, set()).discard(voice.voice_id)
+        self._sorted_ids = None
+    
+    def _sort_key(self, voice_id: str):
+        return self.voices[voice_id].name, voice_id
     
     async def _load_from_disk(self):
         """Load voice cache from disk"""
@@ -99,7 +130,7 @@ class VoiceCache:
             # Convert to serializable format
             data = {}
             for voice_id, voice in self.voices.items():
-                voice_dict = voice.dict()
+                voice_dict = voice.model_dump()
                 # Convert datetime objects to ISO strings
                 if 'created_at' in voice_dict:
                     voice_dict['created_at'] = voice_dict['created_at'].isoformat()
@@ -148,7 +179,8 @@ class VoiceCache:
                        model_data: Optional[Dict[str, Any]] = None,
                        file_size: Optional[int] = None,
                        duration: Optional[float] = None,
-                       sample_rate: Optional[int] = None) -> VoiceInDB:
+                       sample_rate: Optional[int] = None,
+                       audio_hash: Optional[str] = None) -> VoiceInDB:
         """Add a new voice to the cache"""
         async with self._lock:
             if voice_create.voice_id in self.voices:
@@ -156,20 +188,30 @@ class VoiceCache:
             
             now = datetime.utcnow()
             voice = VoiceInDB(
-                **voice_create.dict(),
+                **voice_create.model_dump(),
                 created_at=now,
                 updated_at=now,
                 audio_file_path=audio_file_path,
                 model_data=model_data,
                 file_size=file_size,
                 duration=duration,
-                sample_rate=sample_rate
+                sample_rate=sample_rate,
+                audio_hash=audio_hash
             )
             
             self.voices[voice_create.voice_id] = voice
+            self._index(voice)
             await self._save_to_disk()
             return voice
     
+    async def find_by_audio_hash(self, audio_hash: str, prompt_text: Optional[str]) -> Optional[VoiceInDB]:
+        """Get a voice enrolled from the same audio and prompt text that already has model data"""
+        for voice_id in self._by_audio_hash.get(audio_hash, ()):
+            voice = self.voices[voice_id]
+            if voice.model_data and voice.prompt_text == prompt_text:
+                return voice
+        return None
+    
     async def get_voice(self, voice_id: str) -> Optional[VoiceInDB]:
         """Get a voice by ID"""
         return self.voices.get(voice_id)
@@ -177,21 +219,26 @@ class VoiceCache:
     async def list_voices(self, voice_type: Optional[VoiceType] = None,
                          language: Optional[str] = None,
                          page: int = 1, page_size: int = 50) -> tuple[List[VoiceInDB], int]:
-        """List voices with optional filtering and pagination"""
-        voices = list(self.voices.values())
-        
-        # Apply filters
-        if voice_type:
-            voices = [v for v in voices if v.voice_type == voice_type]
-        if language:
-            voices = [v for v in voices if v.language == language]
+        """List voices ordered by (name, voice_id), with optional filtering and pagination"""
+        if voice_type or language:
+            # Intersect the filter indexes, smallest first, instead of scanning every voice
+            candidates = []
+            if voice_type:
+                candidates.append(self._by_type.get(voice_type, set()))
+            if language:
+                candidates.append(self._by_language.get(language, set()))
+            candidates.sort(key=len)
+            voice_ids = sorted(candidates[0].intersection(*candidates[1:]), key=self._sort_key)
+        else:
+            if self._sorted_ids is None:
+                self._sorted_ids = sorted(self.voices, key=self._sort_key)
+            voice_ids = self._sorted_ids
         
-        total = len(voices)
+        total = len(voice_ids)
         
         # Apply pagination
         start = (page - 1) * page_size
-        end = start + page_size
-        voices = voices[start:end]
+        voices = [self.voices[voice_id] for voice_id in voice_ids[start:start + page_size]]
         
         return voices, total
     
@@ -203,9 +250,11 @@ class VoiceCache:
                 return None
 
             # Update fields
-            update_data = voice_update.dict(exclude_unset=True)
+            update_data = voice_update.model_dump(exclude_unset=True)
+            self._unindex(voice)
             for field, value in update_data.items():
                 setattr(voice, field, value)
+            self._index(voice)
 
             voice.updated_at = datetime.utcnow()
             await self._save_to_disk()
@@ -238,6 +287,7 @@ class VoiceCache:
                     print(f"Warning: Failed to remove audio file {voice.audio_file_path}: {e}")
             
             # Remove from cache
+            self._unindex(voice)
             del self.voices[voice_id]
             await self._save_to_disk()
             return True
@@ -6,10 +6,14 @@ Handles CosyVoice model initialization and voice management
 import os
 import sys
 import asyncio
+import hashlib
 import logging
+import struct
 from typing import Optional, Dict, Any, List, Generator
 from pathlib import Path
 
+import torch
+
 # Path setup should be handled by main.py - keep this simple
 # Just add the basic cosyvoice path if needed
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -21,6 +25,7 @@ from cosyvoice.cli.cosyvoice import CosyVoice, CosyVoice2
 from cosyvoice.utils.file_utils import load_wav
 
 from app.core.voice_cache import VoiceCache
+from app.core.embedding_cache import VoiceEmbeddingCache
 from app.core.config import settings
 from app.models.voice import VoiceInDB, VoiceCreate, VoiceUpdate, VoiceType
 from app.utils.audio import audio_processor
@@ -29,6 +34,50 @@ from app.utils.file_utils import file_manager
 logger = logging.getLogger(__name__)
 
 
+def compile_model(model):
+    """
+    Compile the flow decoder's estimator, which runs once per ODE step for every chunk, and the
+    HiFT vocoder's decode, which runs once per chunk
+    torch.compile specializes on input shapes, and with "reduce-overhead" replays each shape as a
+    CUDA graph, so a cached voice (fixed prompt length) reuses its compiled graph on every request
+    The LLM is left eager: its KV cache grows every step, so each step would be a new shape
+    """
+    flow_decoder = model.model.flow.decoder
+    if isinstance(flow_decoder.estimator, torch.nn.Module):
+        flow_decoder.estimator = torch.compile(flow_decoder.estimator, mode="reduce-overhead")
+    else:
+        logger.info("Flow estimator is a TensorRT engine; skipping torch.compile")
+    hift = model.model.hift
+    hift.decode = torch.compile(hift.decode, mode="reduce-overhead")
+    logger.info("Compiled flow estimator and vocoder with torch.compile")
+
+
+def audio_hasher():
+    """Hasher for the content of uploaded voice audio; voices with equal digests share model data"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def voices_etag(voices: List[VoiceInDB], total: Optional[int] = None) -> str:
+    """Strong ETag over voice ids and their last update times (and the listing total, if given)"""
+    hasher = hashlib.blake2b(digest_size=8)
+    if total is not None:
+        hasher.update(struct.pack("<q", total))
+    for voice in voices:
+        hasher.update(voice.voice_id.encode())
+        hasher.update(b"\0")
+        hasher.update(struct.pack("<d", voice.updated_at.timestamp()))
+    return f'"{hasher.hexdigest()}"'
+
+
+def voice_features_key(voice: VoiceInDB) -> str:
+    """
+    Embedding cache key of a cached voice's prompt features
+    A voice's audio never changes while it exists, so its id and creation time identify it;
+    deleting the voice drops the entry, and a voice re-created under the same id gets a new key
+    """
+    return f"voice:{voice.voice_id}:{voice.created_at.timestamp()}"
+
+
 class VoiceManager:
     """Main voice manager class"""
     
@@ -36,6 +85,10 @@ class VoiceManager:
         self.model_dir = model_dir
         self.cache_dir = cache_dir
         self.voice_cache = VoiceCache(cache_dir, settings.VOICE_CACHE_DB)
+        self.embedding_cache = VoiceEmbeddingCache(
+            capacity=settings.EMBEDDING_CACHE_SIZE,
+            persist_path=settings.EMBEDDING_CACHE_FILE
+        )
         self.cosyvoice_model: Optional[CosyVoice] = None
         self.cosyvoice2_model: Optional[CosyVoice2] = None
         self._initialized = False
@@ -53,6 +106,7 @@ class VoiceManager:
             try:
                 # Initialize voice cache
                 await self.voice_cache.initialize()
+                await self.embedding_cache.load()
                 logger.info("Voice cache initialized")
                 
                 # Initialize CosyVoice models
@@ -78,7 +132,7 @@ class VoiceManager:
                 raise ValueError(f"Model directory not found: {self.model_dir}")
             
             # Initialize models in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             
             # Try to initialize CosyVoice2 first, fallback to CosyVoice
             try:
@@ -105,11 +159,23 @@ class VoiceManager:
     
     def _init_cosyvoice2_sync(self) -> CosyVoice2:
         """Synchronously initialize CosyVoice2 model"""
-        return CosyVoice2(self.model_dir)
+        model = CosyVoice2(
+            self.model_dir, load_jit=settings.LOAD_JIT, load_trt=settings.LOAD_TRT,
+            load_vllm=settings.LOAD_VLLM, fp16=settings.FP16, trt_concurrent=settings.SYNTH_WORKERS
+        )
+        if settings.COMPILE_INFERENCE:
+            compile_model(model)
+        return model
     
     def _init_cosyvoice_sync(self) -> CosyVoice:
         """Synchronously initialize CosyVoice model"""
-        return CosyVoice(self.model_dir)
+        model = CosyVoice(
+            self.model_dir, load_jit=settings.LOAD_JIT, load_trt=settings.LOAD_TRT,
+            fp16=settings.FP16, trt_concurrent=settings.SYNTH_WORKERS
+        )
+        if settings.COMPILE_INFERENCE:
+            compile_model(model)
+        return model
     
     async def _load_cached_voices(self):
         """Load cached voices into the model"""
@@ -158,20 +224,32 @@ class VoiceManager:
     
     async def add_voice(self, voice_create: VoiceCreate, audio_file_content: bytes) -> VoiceInDB:
         """Add a new voice to the cache"""
+        # Save audio file
+        temp_file = await file_manager.save_temp_file(
+            audio_file_content, 
+            f"{voice_create.voice_id}.{voice_create.audio_format.value}"
+        )
+        hasher = audio_hasher()
+        hasher.update(audio_file_content)
+        return await self.add_voice_from_path(voice_create, temp_file, hasher.hexdigest())
+    
+    async def add_voice_from_path(self, voice_create: VoiceCreate, temp_file: str,
+                                  audio_hash: Optional[str] = None) -> VoiceInDB:
+        """
+        Add a new voice to the cache from an audio file on disk; temp_file is removed afterwards
+        audio_hash is the audio_hasher digest of the file: an existing voice enrolled from the same
+        audio and prompt text lends its model data instead of running the frontend again
+        """
         if not self._initialized:
+            file_manager.delete_file(temp_file)
             raise RuntimeError("Voice manager not initialized")
         
         # Validate voice doesn't already exist
         if await self.voice_cache.voice_exists(voice_create.voice_id):
+            file_manager.delete_file(temp_file)
             raise ValueError(f"Voice with ID '{voice_create.voice_id}' already exists")
         
         try:
-            # Save audio file
-            temp_file = await file_manager.save_temp_file(
-                audio_file_content, 
-                f"{voice_create.voice_id}.{voice_create.audio_format.value}"
-            )
-            
             # Validate audio file
             is_valid, error_msg = await audio_processor.validate_audio_file(temp_file)
             if not is_valid:
@@ -188,9 +266,7 @@ class VoiceManager:
                 voice_create.audio_format.value
             )
             
-            # Ensure target directory exists
-            file_manager.ensure_directory_exists(os.path.dirname(target_path))
-            
+            # copy_file / convert_audio_format create the target directory
             # Convert/copy audio file
             if voice_create.audio_format.value != "wav":
                 success = await audio_processor.convert_audio_format(
@@ -211,9 +287,16 @@ class VoiceManager:
             # Generate model data for voices that need it
             model_data = None
             if voice_create.voice_type in [VoiceType.ZERO_SHOT, VoiceType.CROSS_LINGUAL, VoiceType.SFT]:
-                model_data = await self._generate_voice_model_data(
-                    target_path, voice_create.prompt_text or ""
-                )
+                existing = None
+                if audio_hash:
+                    existing = await self.voice_cache.find_by_audio_hash(audio_hash, voice_create.prompt_text)
+                if existing:
+                    logger.info("Reusing model data of voice %s for %s", existing.voice_id, voice_create.voice_id)
+                    model_data = existing.model_data
+                else:
+                    model_data = await self._generate_voice_model_data(
+                        target_path, voice_create.prompt_text or ""
+                    )
             
             # Add to cache
             voice = await self.voice_cache.add_voice(
@@ -222,7 +305,8 @@ class VoiceManager:
                 model_data=model_data,
                 file_size=file_manager.get_file_size(target_path),
                 duration=duration,
-                sample_rate=sample_rate
+                sample_rate=sample_rate,
+                audio_hash=audio_hash
             )
             
             # Add to active model if it has model data
@@ -245,16 +329,15 @@ class VoiceManager:
             if not model or not hasattr(model, 'frontend'):
                 return None
 
-            # Load audio
-            loop = asyncio.get_event_loop()
-            prompt_speech_16k = await loop.run_in_executor(
-                None, load_wav, audio_path, 16000
-            )
+            def _extract():
+                # Load audio and generate model input using zero-shot method
+                prompt_speech_16k = load_wav(audio_path, 16000)
+                return model.frontend.frontend_zero_shot(
+                    '', prompt_text, prompt_speech_16k, model.sample_rate, ''
+                )
 
-            # Generate model input using zero-shot method
-            model_input = model.frontend.frontend_zero_shot(
-                '', prompt_text, prompt_speech_16k, model.sample_rate, ''
-            )
+            # One executor hop for decoding and the frontend, so neither blocks the event loop
+            model_input = await asyncio.get_running_loop().run_in_executor(None, _extract)
 
             # Remove text-related fields to get speaker embedding
             if 'text' in model_input:
@@ -282,6 +365,11 @@ class VoiceManager:
         """Get a voice by ID"""
         return await self.voice_cache.get_voice(voice_id)
     
+    async def get_voice_etag(self, voice_id: str) -> Optional[str]:
+        """ETag of a voice's current version, or None if it does not exist"""
+        voice = await self.get_voice(voice_id)
+        return voices_etag([voice]) if voice else None
+    
     async def list_voices(self, **kwargs) -> tuple[List[VoiceInDB], int]:
         """List voices with filtering and pagination"""
         return await self.voice_cache.list_voices(**kwargs)
@@ -296,6 +384,11 @@ class VoiceManager:
         model = self._get_active_model()
         if model and hasattr(model, 'frontend') and voice_id in model.frontend.spk2info:
             del model.frontend.spk2info[voice_id]
+
+        # Drop its prompt features rather than leaving them to age out of the LRU
+        voice = self.voice_cache.voices.get(voice_id)
+        if voice:
+            await self.embedding_cache.discard(voice_features_key(voice))
         
         # Remove from cache
         return await self.voice_cache.delete_voice(voice_id)
@@ -314,5 +407,5 @@ class VoiceManager:
     async def cleanup(self):
         """Cleanup resources"""
         logger.info("Cleaning up voice manager...")
-        await audio_processor.cleanup()
+        await self.embedding_cache.save()
         logger.info("Voice manager cleanup complete")
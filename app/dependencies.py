@@ -1,35 +1,38 @@
 """
 FastAPI dependencies for dependency injection
+Shared instances are created once in the app lifespan and kept on app.state
+The dependencies are async so FastAPI calls them inline instead of in its threadpool
 """
 
-from typing import Optional
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
 
 from app.core.synthesis_engine import SynthesisEngine
 from app.core.voice_manager import VoiceManager
+from app.core.async_synthesis_manager import AsyncSynthesisManager
+from app.core.exceptions import ModelNotReadyError
 
-# Global instances (will be set during startup)
-_synthesis_engine: Optional[SynthesisEngine] = None
-_voice_manager: Optional[VoiceManager] = None
-
-def set_synthesis_engine(engine: SynthesisEngine):
-    """Set the global synthesis engine instance"""
-    global _synthesis_engine
-    _synthesis_engine = engine
-
-def set_voice_manager(manager: VoiceManager):
-    """Set the global voice manager instance"""
-    global _voice_manager
-    _voice_manager = manager
-
-def get_synthesis_engine() -> SynthesisEngine:
-    """Get the synthesis engine dependency"""
-    if _synthesis_engine is None:
-        raise HTTPException(status_code=503, detail="Synthesis engine not ready")
-    return _synthesis_engine
-
-def get_voice_manager() -> VoiceManager:
-    """Get the voice manager dependency"""
-    if _voice_manager is None:
-        raise HTTPException(status_code=503, detail="Voice manager not ready")
-    return _voice_manager
+
+async def get_synthesis_engine(request: Request) -> SynthesisEngine:
+    """Get the shared synthesis engine"""
+    synthesis_engine = getattr(request.app.state, 'synthesis_engine', None)
+    if not synthesis_engine:
+        raise HTTPException(status_code=503, detail="Synthesis engine not available")
+    return synthesis_engine
+
+
+async def get_voice_manager(request: Request) -> VoiceManager:
+    """Get the shared voice manager once its model is loaded"""
+    voice_manager = getattr(request.app.state, 'voice_manager', None)
+    if not voice_manager:
+        raise HTTPException(status_code=503, detail="Voice manager not available")
+    if not request.app.state.voice_manager_ready.is_set():
+        raise ModelNotReadyError("Voice manager is not ready")
+    return voice_manager
+
+
+async def get_async_synthesis_manager(request: Request) -> AsyncSynthesisManager:
+    """Get the shared async synthesis manager"""
+    async_manager = getattr(request.app.state, 'async_synthesis_manager', None)
+    if not async_manager:
+        raise HTTPException(status_code=503, detail="Async synthesis manager not available")
+    return async_manager
@@ -1,14 +1,26 @@
 """Simplified Synthesis models for CosyVoice2 API - 跨语种复刻 (Cross-lingual Voice Cloning)"""
+from datetime import datetime
 from typing import Optional
+from fastapi import UploadFile
 from pydantic import BaseModel, Field
 from .voice import AudioFormat
 
+# 跨语种复刻 - 带音频文件 表单 (Form fields of the with-audio endpoint)
+class CrossLingualWithAudioForm(BaseModel):
+    """跨语种复刻 - 带音频文件 表单 (multipart form)"""
+    text: str = Field(..., description="要合成的文本 (Text to synthesize)", max_length=2000)
+    format: AudioFormat = Field(AudioFormat.WAV, description="输出音频格式")
+    speed: float = Field(1.0, ge=0.5, le=2.0, description="语速倍数")
+    stream: bool = Field(False, description="是否流式推理 (默认: 否)")
+    prompt_audio: UploadFile = Field(..., description="参考音频文件 (Reference audio file)")
+
 # 跨语种复刻 - 带音频文件 (Cross-lingual with audio file)
 class CrossLingualWithAudioRequest(BaseModel):
     """跨语种复刻 - 带音频文件"""
     text: str = Field(..., description="要合成的文本 (Text to synthesize)", max_length=2000)
     prompt_text: str = Field(..., description="输入prompt文本 (Reference text that matches the prompt audio)")
     prompt_audio_url: str = Field(..., description="参考音频文件路径 (URL or path to reference audio file)")
+    prompt_audio_key: Optional[str] = Field(None, description="参考音频内容哈希 (BLAKE2b-128 of the reference audio, used as embedding cache key)")
     instruct_text: Optional[str] = Field(None, description="输入instruct文本 (Optional instruction for voice style/emotion)")
     format: AudioFormat = Field(AudioFormat.WAV, description="输出音频格式")
     speed: float = Field(1.0, ge=0.5, le=2.0, description="语速倍数")
@@ -62,8 +74,8 @@ class AsyncTaskStatusResponse(BaseModel):
     duration: Optional[float] = Field(None, description="音频时长(秒) (仅completed状态)")
     synthesis_time: Optional[float] = Field(None, description="合成耗时(秒) (仅completed状态)")
     error_message: Optional[str] = Field(None, description="错误信息 (仅failed状态)")
-    created_at: Optional[str] = Field(None, description="任务创建时间")
-    completed_at: Optional[str] = Field(None, description="任务完成时间")
+    created_at: Optional[datetime] = Field(None, description="任务创建时间")
+    completed_at: Optional[datetime] = Field(None, description="任务完成时间")
 
 class SynthesisResponse(BaseModel):
     success: bool = Field(..., description="Whether synthesis was successful")
@@ -41,6 +41,7 @@ class VoiceInDB(VoiceBase):
     duration: Optional[float] = Field(None, description="Audio duration in seconds")
     sample_rate: Optional[int] = Field(None, description="Audio sample rate")
     model_data: Optional[Dict[str, Any]] = Field(None, description="Model-specific data for voice synthesis")
+    audio_hash: Optional[str] = Field(None, description="BLAKE2b digest of the uploaded audio, used to reuse model data")
     is_active: bool = Field(True, description="Whether the voice is active")
 
 class VoiceResponse(VoiceBase):
@@ -10,17 +10,30 @@ import numpy as np
 from pathlib import Path
 from typing import Tuple, Optional, Union
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 from app.models.voice import AudioFormat
 from app.core.config import settings
 
+# Bytes of an upload needed to recognise its container format
+AUDIO_MAGIC_SIZE = 16
+
+
+def detect_audio_format(head: bytes) -> Optional[str]:
+    """Identify wav/flac/mp3/m4a from the first AUDIO_MAGIC_SIZE bytes of a file, or None"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[4:8] == b"ftyp":
+        return "m4a"
+    # ID3 tag, or a bare MPEG audio frame sync
+    if head[:3] == b"ID3" or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
 
 class AudioProcessor:
-    """Audio processing utilities"""
-    
-    def __init__(self):
-        self.executor = ThreadPoolExecutor(max_workers=4)
+    """Audio processing utilities; blocking work runs on the event loop's default executor"""
     
     async def validate_audio_file(self, file_path: str) -> Tuple[bool, Optional[str]]:
         """
@@ -60,9 +73,9 @@ class AudioProcessor:
     async def _get_audio_info(self, file_path: str) -> Optional[Tuple[float, int, int]]:
         """Get audio file information (duration, sample_rate, channels)"""
         try:
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             return await loop.run_in_executor(
-                self.executor, 
+                None,
                 self._get_audio_info_sync, 
                 file_path
             )
@@ -72,16 +85,15 @@ class AudioProcessor:
     def _get_audio_info_sync(self, file_path: str) -> Tuple[float, int, int]:
         """Synchronous version of get_audio_info"""
         try:
-            # Try with librosa first
-            y, sr = librosa.load(file_path, sr=None)
-            duration = len(y) / sr
+            # libsndfile reads duration, rate and channels from the header without decoding the audio
+            info = sf.info(file_path)
+            return info.frames / info.samplerate, info.samplerate, info.channels
+        except Exception:
+            # Fallback to decoding with librosa for containers libsndfile cannot open (e.g. m4a)
+            y, sr = librosa.load(file_path, sr=None, mono=False)
+            duration = y.shape[-1] / sr
             channels = 1 if y.ndim == 1 else y.shape[0]
             return duration, sr, channels
-        except Exception:
-            # Fallback to soundfile
-            with sf.SoundFile(file_path) as f:
-                duration = len(f) / f.samplerate
-                return duration, f.samplerate, f.channels
     
     async def convert_audio_format(self, input_path: str, output_path: str, 
                                  target_format: AudioFormat, 
@@ -91,9 +103,9 @@ class AudioProcessor:
         Returns: success status
         """
         try:
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             return await loop.run_in_executor(
-                self.executor,
+                None,
                 self._convert_audio_format_sync,
                 input_path, output_path, target_format, target_sample_rate
             )
@@ -152,9 +164,9 @@ class AudioProcessor:
         Returns: success status
         """
         try:
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             return await loop.run_in_executor(
-                self.executor,
+                None,
                 self._resample_audio_sync,
                 input_path, output_path, target_sample_rate
             )
@@ -187,9 +199,9 @@ class AudioProcessor:
         Returns: success status
         """
         try:
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             return await loop.run_in_executor(
-                self.executor,
+                None,
                 self._normalize_audio_sync,
                 input_path, output_path, target_db
             )
@@ -237,10 +249,7 @@ class AudioProcessor:
     def get_file_extension(self, format: AudioFormat) -> str:
         """Get file extension for audio format"""
         return f".{format.value}"
-    
-    async def cleanup(self):
-        """Cleanup resources"""
-        self.executor.shutdown(wait=True)
+
 
 
 # Global audio processor instance
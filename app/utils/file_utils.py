@@ -3,7 +3,6 @@ File handling utilities for CosyVoice2 API
 """
 
 import os
-import uuid
 import tempfile
 import shutil
 import aiofiles
@@ -13,6 +12,12 @@ from datetime import datetime, timedelta
 
 from app.core.config import settings
 
+# URL of a generated audio file served from the outputs directory
+AUDIO_URL_TMPL = "/api/v1/audio/{}".format
+
+# Chunk size for streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 class FileManager:
     """File management utilities"""
@@ -20,11 +25,13 @@ class FileManager:
     def __init__(self):
         self.temp_dir = Path(tempfile.gettempdir()) / "cosyvoice2_api"
         self.temp_dir.mkdir(exist_ok=True)
+        # Directories already created by this process, so repeated writes skip the mkdir syscalls
+        self._created_dirs = {str(self.temp_dir)}
     
     def generate_unique_filename(self, original_filename: str, prefix: str = "") -> str:
-        """Generate a unique filename with timestamp and UUID"""
+        """Generate a unique filename with timestamp and random hex suffix"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
+        unique_id = os.urandom(4).hex()
         
         # Extract file extension
         file_ext = Path(original_filename).suffix
@@ -45,7 +52,7 @@ class FileManager:
         """
         # Ensure destination directory exists
         dest_path = Path(destination_dir)
-        dest_path.mkdir(parents=True, exist_ok=True)
+        self.ensure_directory_exists(destination_dir)
         
         # Generate unique filename
         unique_filename = self.generate_unique_filename(filename)
@@ -64,6 +71,10 @@ class FileManager:
         """
         return await self.save_uploaded_file(file_content, filename, str(self.temp_dir))
     
+    def get_temp_file_path(self, filename: str) -> str:
+        """Get a unique path in the temporary directory for a file named like filename"""
+        return str(self.temp_dir / self.generate_unique_filename(filename))
+    
     def get_voice_audio_path(self, voice_id: str, audio_format: str) -> str:
         """Get the file path for a voice audio file"""
         filename = f"{voice_id}.{audio_format}"
@@ -80,8 +91,7 @@ class FileManager:
         """
         try:
             # Ensure destination directory exists
-            dest_dir = Path(destination_path).parent
-            dest_dir.mkdir(parents=True, exist_ok=True)
+            self.ensure_directory_exists(os.path.dirname(destination_path))
             
             # Copy file
             shutil.copy2(source_path, destination_path)
@@ -98,8 +108,7 @@ class FileManager:
         """
         try:
             # Ensure destination directory exists
-            dest_dir = Path(destination_path).parent
-            dest_dir.mkdir(parents=True, exist_ok=True)
+            self.ensure_directory_exists(os.path.dirname(destination_path))
             
             # Move file
             shutil.move(source_path, destination_path)
@@ -185,8 +194,11 @@ class FileManager:
             return full_path
     
     def ensure_directory_exists(self, directory_path: str):
-        """Ensure directory exists, create if it doesn't"""
-        Path(directory_path).mkdir(parents=True, exist_ok=True)
+        """Ensure directory exists, create if it doesn't; only the first call per directory touches the disk"""
+        directory_path = str(directory_path)
+        if directory_path not in self._created_dirs:
+            Path(directory_path).mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(directory_path)
 
 
 # Global file manager instance
@@ -235,7 +235,7 @@ from typing import Dict, Any
 import uvicorn
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.core.config import settings
@@ -243,7 +243,9 @@ from app.core.voice_manager import VoiceManager
 from app.core.synthesis_engine import SynthesisEngine
 from app.core.async_synthesis_manager import AsyncSynthesisManager
 from app.api.v1.router import api_router
+from app.api.v1.tasks import task_store
 from app.core.exceptions import setup_exception_handlers
+from app.core.middleware import ContentSizeLimitMiddleware
 
 # Configure logging
 logging.basicConfig(
@@ -264,15 +266,20 @@ async def lifespan(app: FastAPI):
 
     logger.info("Starting CosyVoice2 API server...")
 
-    # Configure thread pool for MAXIMUM parallelism
-    loop = asyncio.get_event_loop()
+    # Default thread pool for file and audio I/O; model calls run on the synthesis engine's own threads
+    loop = asyncio.get_running_loop()
     executor = concurrent.futures.ThreadPoolExecutor(
         max_workers=16,  # High thread count for true parallelism
-        thread_name_prefix="synthesis_"
+        thread_name_prefix="io_"
     )
     loop.set_default_executor(executor)
     logger.info(f"Thread pool configured with {executor._max_workers} workers for unlimited parallel processing")
 
+    # Flipped once the model is loaded so request dependencies skip is_ready()
+    app.state.voice_manager_ready = asyncio.Event()
+    preload = None
+    warmup = None
+
     try:
         # Initialize voice manager
         voice_manager = VoiceManager(
@@ -282,23 +289,38 @@ async def lifespan(app: FastAPI):
 
         # Load cached voices on startup
         await voice_manager.initialize()
+        if voice_manager.is_ready():
+            app.state.voice_manager_ready.set()
         logger.info("Voice manager initialized successfully")
 
         # Initialize async synthesis manager
         logger.info("Initializing async synthesis manager...")
         synthesis_engine = SynthesisEngine(voice_manager)
         # NO LIMITS - unlimited parallel processing!
-        async_synthesis_manager = AsyncSynthesisManager(synthesis_engine, max_concurrent=999)
+        async_synthesis_manager = AsyncSynthesisManager(
+            synthesis_engine,
+            max_concurrent=settings.SYNTH_WORKER_CONCURRENCY,
+            max_batch_size=settings.ASYNC_BATCH_SIZE,
+            batch_window=settings.ASYNC_BATCH_WINDOW_MS / 1000,
+            max_tasks=settings.ASYNC_MAX_TASKS,
+            max_queue_size=settings.ASYNC_QUEUE_SIZE
+        )
         await async_synthesis_manager.start()
         logger.info("Async synthesis manager initialized for unlimited parallel processing")
 
-        # Set dependencies for task-based API
-        from app.dependencies import set_synthesis_engine, set_voice_manager
-        set_synthesis_engine(synthesis_engine)
-        set_voice_manager(voice_manager)
+        # Warm the prompt features of cached voices in the background; requests are served meanwhile
+        if settings.PRELOAD_VOICE_FEATURES:
+            preload = asyncio.create_task(synthesis_engine.preload_cached_voices())
+        # Pay torch.compile's tracing cost before the first request does
+        if settings.COMPILE_INFERENCE:
+            warmup = asyncio.create_task(synthesis_engine.warmup())
+
+        # Reap finished task-based synthesis records
+        task_store.start()
 
         # Store in app state for access in routes
         app.state.voice_manager = voice_manager
+        app.state.synthesis_engine = synthesis_engine
         app.state.async_synthesis_manager = async_synthesis_manager
 
         yield
@@ -308,8 +330,13 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         logger.info("Shutting down CosyVoice2 API server...")
+        if preload:
+            preload.cancel()
+        if warmup:
+            warmup.cancel()
         if async_synthesis_manager:
             await async_synthesis_manager.stop()
+        await task_store.stop()
         if voice_manager:
             await voice_manager.cleanup()
 
@@ -323,9 +350,18 @@ def create_app() -> FastAPI:
         version="2.0.0",
         docs_url="/docs",
         redoc_url="/redoc",
+        default_response_class=ORJSONResponse,
         lifespan=lifespan
     )
     
+    # Reject oversized bodies before they are spooled; voice uploads get MAX_FILE_SIZE plus room for form fields.
+    # Added before CORS so that CORS wraps it and browsers can read its 413s
+    app.add_middleware(
+        ContentSizeLimitMiddleware,
+        max_size=settings.MAX_REQUEST_SIZE,
+        path_limits={"/api/v1/voices": settings.MAX_FILE_SIZE + 64 * 1024},
+    )
+    
     # Add CORS middleware
     app.add_middleware(
         CORSMiddleware,
@@ -363,7 +399,7 @@ def create_app() -> FastAPI:
         """Health check endpoint"""
         return {
             "status": "healthy",
-            "voice_manager_ready": voice_manager is not None and voice_manager.is_ready(),
+            "voice_manager_ready": app.state.voice_manager_ready.is_set(),
             "api_mode": "跨语种复刻 (Cross-lingual Voice Cloning)"
         }
     
@@ -380,5 +416,7 @@ if __name__ == "__main__":
         host=settings.HOST,
         port=settings.PORT,
         reload=settings.DEBUG,
+        # uvloop (from uvicorn[standard]) schedules tasks and sockets faster; it has no Windows build
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
         log_level="info"
     )
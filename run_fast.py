@@ -39,6 +39,8 @@ def main():
             "--port", "8012", 
             "--workers", "1"
         ]
+        if sys.platform != "win32":
+            cmd += ["--loop", "uvloop"]
         
         subprocess.run(cmd, check=True)
         
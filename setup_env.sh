@@ -128,12 +128,13 @@ install_dependencies() {
                 openai-whisper==20231117 \
                 pyarrow==18.1.0 \
                 pydantic==2.7.0 \
+                pydantic-settings==2.2.1 \
                 pyworld==0.3.4 \
                 rich==13.7.1 \
                 soundfile==0.12.1 \
                 tensorboard==2.14.0 \
                 transformers==4.51.3 \
-                uvicorn==0.30.0 \
+                "uvicorn[standard]==0.30.0" \
                 wetext==0.0.4 \
                 wget==3.2
     
@@ -2,13 +2,21 @@
 Tests for API endpoints
 """
 
+import io
+
 import pytest
+from fastapi import HTTPException, UploadFile
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, AsyncMock
 
 from main import create_app
 from app.core.voice_manager import VoiceManager
 from app.models.voice import VoiceInDB, VoiceType, AudioFormat
+from app.api.v1.voices import _spool_audio_upload
+from app.utils.file_utils import file_manager
+
+WAV_HEAD = b"RIFF\x24\x00\x00\x00WAVEfmt " + bytes(32)
+MP3_HEAD = b"ID3\x04\x00\x00" + bytes(58)
 
 
 @pytest.fixture
@@ -162,3 +170,33 @@ def test_audio_file_not_found(client):
     """Test serving non-existent audio file"""
     response = client.get("/api/v1/synthesize/audio/non_existent.wav")
     assert response.status_code == 404
+
+
+def _upload(content: bytes, filename: str = "voice.wav") -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename=filename)
+
+
+@pytest.mark.asyncio
+async def test_spool_audio_upload_matching_format():
+    """Test an upload whose content matches audio_format is spooled whatever its file name"""
+    temp_file, audio_hash = await _spool_audio_upload(_upload(MP3_HEAD, "voice.wav"), "voice_a", AudioFormat.MP3)
+    try:
+        assert temp_file.endswith(".mp3")
+        with open(temp_file, "rb") as f:
+            assert f.read() == MP3_HEAD
+        assert audio_hash
+    finally:
+        file_manager.delete_file(temp_file)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("content, declared_format", [
+    (MP3_HEAD, AudioFormat.WAV),
+    (WAV_HEAD, AudioFormat.MP3),
+    (b"not audio at all" * 8, AudioFormat.WAV),
+])
+async def test_spool_audio_upload_rejects_mismatched_content(content, declared_format):
+    """Test content that is not audio, or not the declared audio_format, is rejected with 415"""
+    with pytest.raises(HTTPException) as exc_info:
+        await _spool_audio_upload(_upload(content), "voice_a", declared_format)
+    assert exc_info.value.status_code == 415
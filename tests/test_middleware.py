@@ -0,0 +1,105 @@
+"""
+Tests for ASGI middleware
+"""
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.testclient import TestClient
+
+from app.core.middleware import ContentSizeLimitMiddleware
+
+
+MAX_SIZE = 100
+UPLOAD_LIMIT = 1000
+
+
+@pytest.fixture
+def app():
+    """App echoing the size of the body it read, behind the size limit and CORS as in main.create_app"""
+    app = FastAPI()
+    app.state.bodies_read = 0
+
+    async def echo_size(request: Request):
+        body = await request.body()
+        request.app.state.bodies_read += 1
+        return {"size": len(body)}
+
+    app.add_api_route("/echo", echo_size, methods=["POST"])
+    app.add_api_route("/api/v1/voices/upload", echo_size, methods=["POST"])
+    app.add_middleware(
+        ContentSizeLimitMiddleware,
+        max_size=MAX_SIZE,
+        path_limits={"/api/v1/voices": UPLOAD_LIMIT},
+    )
+    app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return TestClient(app)
+
+
+def _chunks(total: int, chunk_size: int = 10):
+    """Body sent without a Content-Length, as chunked transfer encoding"""
+    for start in range(0, total, chunk_size):
+        yield b"x" * min(chunk_size, total - start)
+
+
+def test_under_limit_passes_through(client):
+    """Test bodies within the limit reach the endpoint intact"""
+    response = client.post("/echo", content=b"x" * MAX_SIZE)
+    assert response.status_code == 200
+    assert response.json() == {"size": MAX_SIZE}
+
+
+def test_declared_length_over_limit_rejected_before_reading(client, app):
+    """Test a Content-Length over the limit is answered with 413 without running the endpoint"""
+    response = client.post("/echo", content=b"x" * (MAX_SIZE + 1))
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large"}
+    assert app.state.bodies_read == 0
+
+
+def test_chunked_body_over_limit_rejected(client, app):
+    """Test a body without Content-Length fails with 413 once it crosses the limit"""
+    response = client.post("/echo", content=_chunks(MAX_SIZE + 50))
+    assert response.status_code == 413
+    assert app.state.bodies_read == 0
+
+
+def test_chunked_body_under_limit_passes_through(client):
+    """Test a chunked body within the limit is read in full"""
+    response = client.post("/echo", content=_chunks(MAX_SIZE))
+    assert response.status_code == 200
+    assert response.json() == {"size": MAX_SIZE}
+
+
+def test_path_limit_overrides_default(client):
+    """Test voice upload routes get their own, larger limit"""
+    response = client.post("/api/v1/voices/upload", content=b"x" * (MAX_SIZE * 5))
+    assert response.status_code == 200
+    assert response.json() == {"size": MAX_SIZE * 5}
+
+    response = client.post("/api/v1/voices/upload", content=b"x" * (UPLOAD_LIMIT + 1))
+    assert response.status_code == 413
+
+    response = client.post("/api/v1/voices/upload", content=_chunks(UPLOAD_LIMIT + 10, chunk_size=100))
+    assert response.status_code == 413
+
+
+def test_rejection_carries_cors_headers(client):
+    """Test 413s pass through CORS, so browser clients can read them"""
+    headers = {"Origin": "https://example.com"}
+    response = client.post("/echo", content=b"x" * MAX_SIZE, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "*"
+
+    response = client.post("/echo", content=b"x" * (MAX_SIZE + 1), headers=headers)
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] == "*"
+
+    response = client.post("/echo", content=_chunks(MAX_SIZE + 50), headers=headers)
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] == "*"
@@ -0,0 +1,242 @@
+"""
+Tests for the task stores
+"""
+
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from app.core.task_store import (
+    COMPLETED_KEY, MemoryTaskStore, RedisTaskStore, REFS_KEY, TASK_INDEX_KEY, TASK_KEY
+)
+
+
+@pytest_asyncio.fixture
+async def redis_store(monkeypatch):
+    """Redis task store backed by an in-process fake Redis"""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    import redis.asyncio as aioredis
+    monkeypatch.setattr(aioredis, "from_url", lambda url: fakeredis.aioredis.FakeRedis())
+    store = RedisTaskStore("redis://localhost", ttl=60)
+    yield store
+    await store.stop()
+
+
+def _task(status: str = "pending", content_hash: str = None):
+    task = {"status": status}
+    if content_hash is not None:
+        task["content_hash"] = content_hash
+    return task
+
+
+@pytest.mark.asyncio
+async def test_create_get_update_delete():
+    """Test the basic lifecycle of a task record"""
+    store = MemoryTaskStore()
+    await store.create("t1", _task())
+
+    assert await store.get("t1") == {"status": "pending"}
+    await store.update("t1", {"status": "processing", "progress": 0.5})
+    assert await store.get("t1") == {"status": "processing", "progress": 0.5}
+
+    # Unknown ids are ignored
+    await store.update("missing", {"status": "completed"})
+    assert await store.get("missing") is None
+
+    assert await store.delete("t1") == {"status": "processing", "progress": 0.5}
+    assert await store.get("t1") is None
+    assert await store.delete("t1") is None
+
+
+@pytest.mark.asyncio
+async def test_reaper_drops_finished_tasks_after_ttl():
+    """Test the reaper removes finished tasks older than the TTL and keeps unfinished ones"""
+    store = MemoryTaskStore(ttl=0.05, reap_interval=0.02)
+    await store.create("done", _task("completed", "h1"))
+    await store.create("failed", _task())
+    await store.update("failed", {"status": "failed"})
+    await store.create("running", _task("processing", "h1"))
+
+    store.start()
+    try:
+        await asyncio.sleep(0.2)
+    finally:
+        await store.stop()
+
+    assert await store.get("done") is None
+    assert await store.get("failed") is None
+    assert await store.get("running") == {"status": "processing", "content_hash": "h1"}
+    # The reaped task no longer references the shared result file
+    assert await store.content_refs("h1") == 1
+
+
+@pytest.mark.asyncio
+async def test_reaper_keeps_finished_tasks_within_ttl():
+    """Test finished tasks younger than the TTL survive a reap"""
+    store = MemoryTaskStore(ttl=60, reap_interval=0.02)
+    await store.create("done", _task("completed"))
+
+    store.start()
+    try:
+        await asyncio.sleep(0.1)
+    finally:
+        await store.stop()
+
+    assert await store.get("done") == {"status": "completed"}
+
+
+@pytest.mark.asyncio
+async def test_size_cap_evicts_finished_tasks_first():
+    """Test records over max_size are evicted finished ones first, oldest finish first"""
+    store = MemoryTaskStore(max_size=3)
+    await store.create("running", _task("processing"))
+    await store.create("done1", _task("completed"))
+    await store.create("done2", _task())
+    await store.update("done2", {"status": "failed"})
+
+    await store.create("new1", _task())
+    assert await store.get("done1") is None
+    assert await store.get("running") is not None
+    assert await store.get("done2") is not None
+
+    await store.create("new2", _task())
+    assert await store.get("done2") is None
+    assert await store.get("running") is not None
+    assert await store.get("new1") is not None
+    assert await store.get("new2") is not None
+
+
+@pytest.mark.asyncio
+async def test_size_cap_falls_back_to_least_recently_updated():
+    """Test unfinished tasks are evicted least recently updated first, never the new one"""
+    store = MemoryTaskStore(max_size=2)
+    await store.create("a", _task())
+    await store.create("b", _task())
+    await store.update("a", {"progress": 0.5})
+
+    await store.create("c", _task())
+    assert await store.get("b") is None
+    assert await store.get("a") is not None
+    assert await store.get("c") is not None
+
+    await store.create("d", _task())
+    assert list(store.tasks_storage) == ["c", "d"]
+
+
+@pytest.mark.asyncio
+async def test_content_refs_follow_task_records():
+    """Test content hash references are counted per kept task and released on delete and eviction"""
+    store = MemoryTaskStore(max_size=2)
+    await store.create("t1", _task("completed", "h1"))
+    await store.create("t2", _task("pending", "h1"))
+    assert await store.content_refs("h1") == 2
+    assert await store.content_refs("h2") == 0
+
+    await store.delete("t2")
+    assert await store.content_refs("h1") == 1
+
+    await store.create("t3", _task("pending", "h2"))
+    await store.create("t4", _task("pending", "h2"))
+    # t1 was evicted to make room
+    assert await store.get("t1") is None
+    assert await store.content_refs("h1") == 0
+    assert await store.content_refs("h2") == 2
+
+
+@pytest.mark.asyncio
+async def test_completed_results():
+    """Test the completed content hash memo"""
+    store = MemoryTaskStore()
+    assert not await store.is_completed("h1")
+
+    assert await store.get_completed("h1") is None
+
+    await store.add_completed("h1", 1.5)
+    assert await store.is_completed("h1")
+    assert await store.get_completed("h1") == {"duration": 1.5}
+
+    await store.discard_completed("h1")
+    assert not await store.is_completed("h1")
+    assert await store.get_completed("h1") is None
+    # Discarding an unknown hash is a no-op
+    await store.discard_completed("h2")
+
+
+@pytest.mark.asyncio
+async def test_completed_results_expire_after_ttl():
+    """Test the reaper forgets completed results older than the TTL and keeps younger ones"""
+    store = MemoryTaskStore(ttl=0.2, reap_interval=0.02)
+    await store.add_completed("old", 1.0)
+    await store.add_completed("refreshed", 1.0)
+
+    store.start()
+    try:
+        await asyncio.sleep(0.12)
+        await store.add_completed("refreshed", 1.0)
+        await asyncio.sleep(0.12)
+        assert not await store.is_completed("old")
+        assert await store.is_completed("refreshed")
+        await asyncio.sleep(0.3)
+    finally:
+        await store.stop()
+
+    assert not await store.is_completed("refreshed")
+    assert len(store.completed_results) == 0
+
+
+@pytest.mark.asyncio
+async def test_completed_results_capped_at_max_size():
+    """Test completed results beyond max_size are forgotten least recently recorded first"""
+    store = MemoryTaskStore(max_size=2)
+    await store.add_completed("h1", 1.0)
+    await store.add_completed("h2", 1.0)
+    await store.add_completed("h1", 1.0)
+    await store.add_completed("h3", 1.0)
+
+    assert not await store.is_completed("h2")
+    assert await store.is_completed("h1")
+    assert await store.is_completed("h3")
+
+
+@pytest.mark.asyncio
+async def test_redis_update_never_recreates_removed_task(redis_store):
+    """Test updating a task deleted or expired meanwhile does not leave a partial record behind"""
+    await redis_store.update("missing", {"status": "processing", "progress": 0.3})
+    assert not await redis_store.redis.exists(TASK_KEY("missing"))
+
+    await redis_store.create("t1", _task(content_hash="h1"))
+    await redis_store.delete("t1")
+    await redis_store.update("t1", {"status": "processing", "progress": 0.3})
+    assert not await redis_store.redis.exists(TASK_KEY("t1"))
+    assert await redis_store.redis.zcard(TASK_INDEX_KEY) == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_update_expires_finished_tasks(redis_store):
+    """Test an update to a finished status sets the record's and its reference set's TTL"""
+    await redis_store.create("t1", _task(content_hash="h1"))
+    await redis_store.update("t1", {"status": "processing", "progress": 0.3})
+    assert await redis_store.get("t1") == {"status": "processing", "content_hash": "h1", "progress": 0.3}
+    assert await redis_store.redis.ttl(TASK_KEY("t1")) == -1
+
+    await redis_store.update("t1", {"status": "completed", "progress": 1.0})
+    assert (await redis_store.get("t1"))["status"] == "completed"
+    assert 0 < await redis_store.redis.ttl(TASK_KEY("t1")) <= 60
+    assert 0 < await redis_store.redis.ttl(REFS_KEY("h1")) <= 60
+    assert await redis_store.content_refs("h1") == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_completed_results(redis_store):
+    """Test completed results are recorded with their duration and expire after the TTL"""
+    assert await redis_store.get_completed("h1") is None
+
+    await redis_store.add_completed("h1", 1.5)
+    assert await redis_store.is_completed("h1")
+    assert await redis_store.get_completed("h1") == {"duration": 1.5}
+    assert 0 < await redis_store.redis.ttl(COMPLETED_KEY("h1")) <= 60
+
+    await redis_store.discard_completed("h1")
+    assert await redis_store.get_completed("h1") is None
@@ -0,0 +1,188 @@
+"""
+Tests for task-based synthesis: completed result memo and single flight
+"""
+
+import asyncio
+import os
+from datetime import datetime
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+
+from app.api.v1 import tasks
+from app.core.config import settings
+from app.core.task_store import MemoryTaskStore
+
+
+VOICE_CREATED_AT = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    """Fresh in-process task store, with task results written under tmp_path"""
+    store = MemoryTaskStore()
+    monkeypatch.setattr(tasks, "task_store", store)
+    monkeypatch.setattr(settings, "TASK_BROKER_URL", None)
+    monkeypatch.setattr(settings, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(tasks, "_inflight", {})
+    return store
+
+
+@pytest.fixture
+def synthesis_engine(tmp_path):
+    """Engine whose synthesis writes a result file, optionally held back until `release` is set"""
+    engine = Mock()
+    engine.release = asyncio.Event()
+    engine.release.set()
+    engine.voice_manager.get_voice = AsyncMock(return_value=Mock(created_at=VOICE_CREATED_AT))
+
+    async def synthesize(request):
+        await engine.release.wait()
+        path = tmp_path / f"synth_{engine.synthesize_cross_lingual_with_cache.await_count}.wav"
+        path.write_bytes(b"RIFF")
+        return Mock(file_path=str(path), duration=1.0)
+
+    engine.synthesize_cross_lingual_with_cache = AsyncMock(side_effect=synthesize)
+    return engine
+
+
+async def _create(synthesis_engine, text="Hello world"):
+    """Create a task, returning its response and the background work it scheduled"""
+    background_tasks = BackgroundTasks()
+    response = await tasks.create_synthesis_task(
+        tasks.TaskRequest(text=text, voice_id="voice_a"), background_tasks, synthesis_engine
+    )
+    return response, background_tasks
+
+
+def test_file_path_depends_on_voice_version():
+    """Test a voice re-enrolled under the same id does not share results with the old one"""
+    first = tasks.generate_file_path("Hello", "voice_a", VOICE_CREATED_AT, "wav", 1.0)
+    again = tasks.generate_file_path("Hello", "voice_a", VOICE_CREATED_AT, "wav", 1.0)
+    reenrolled = tasks.generate_file_path("Hello", "voice_a", datetime(2024, 1, 2), "wav", 1.0)
+    assert first == again
+    assert first[0] != reenrolled[0]
+    assert first[1] != reenrolled[1]
+
+
+@pytest.mark.asyncio
+async def test_unknown_voice_rejected(store, synthesis_engine):
+    """Test tasks for a voice that does not exist are rejected with 404"""
+    synthesis_engine.voice_manager.get_voice = AsyncMock(return_value=None)
+    with pytest.raises(HTTPException) as exc_info:
+        await _create(synthesis_engine)
+    assert exc_info.value.status_code == 404
+    assert await store.list() == []
+
+
+@pytest.mark.asyncio
+async def test_identical_task_served_from_completed_result(store, synthesis_engine):
+    """Test an identical task after completion is registered as completed without synthesizing"""
+    first, background_tasks = await _create(synthesis_engine)
+    assert first.status == "registered"
+    await background_tasks()
+    assert (await store.get(first.task_id))["status"] == "completed"
+    assert os.path.exists(first.file_path)
+
+    second, background_tasks = await _create(synthesis_engine)
+    assert second.status == "completed"
+    assert second.file_path == first.file_path
+    assert background_tasks.tasks == []
+    task = await store.get(second.task_id)
+    assert task["status"] == "completed"
+    assert task["duration"] == 1.0
+    assert task["synthesis_time"] == 0.0
+    assert synthesis_engine.synthesize_cross_lingual_with_cache.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_completed_result_with_missing_file_resynthesized(store, synthesis_engine):
+    """Test a completed result whose file was removed is forgotten and synthesized again"""
+    first, background_tasks = await _create(synthesis_engine)
+    await background_tasks()
+    os.remove(first.file_path)
+
+    second, background_tasks = await _create(synthesis_engine)
+    assert second.status == "registered"
+    content_hash = (await store.get(second.task_id))["content_hash"]
+    assert not await store.is_completed(content_hash)
+
+    await background_tasks()
+    assert (await store.get(second.task_id))["status"] == "completed"
+    assert os.path.exists(second.file_path)
+    assert synthesis_engine.synthesize_cross_lingual_with_cache.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_identical_tasks_in_flight_synthesized_once(store, synthesis_engine):
+    """Test identical tasks submitted while one is synthesizing share its run and outcome"""
+    synthesis_engine.release.clear()
+    first, first_background = await _create(synthesis_engine)
+    second, second_background = await _create(synthesis_engine)
+    assert first.task_id != second.task_id
+    assert second.file_path == first.file_path
+
+    running = asyncio.gather(first_background(), second_background())
+    await asyncio.sleep(0)
+    assert (await store.get(second.task_id))["status"] == "processing"
+
+    synthesis_engine.release.set()
+    await running
+
+    assert synthesis_engine.synthesize_cross_lingual_with_cache.await_count == 1
+    for task_id in (first.task_id, second.task_id):
+        task = await store.get(task_id)
+        assert task["status"] == "completed"
+        assert task["duration"] == 1.0
+    assert tasks._inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_identical_tasks_in_flight_share_failure(store, synthesis_engine):
+    """Test a failed synthesis fails every task waiting on it, and a later task retries"""
+    synthesis_engine.synthesize_cross_lingual_with_cache.side_effect = RuntimeError("out of memory")
+    first, first_background = await _create(synthesis_engine)
+    second, second_background = await _create(synthesis_engine)
+    await asyncio.gather(first_background(), second_background())
+
+    for task_id in (first.task_id, second.task_id):
+        task = await store.get(task_id)
+        assert task["status"] == "failed"
+        assert task["error_message"] == "out of memory"
+    assert tasks._inflight == {}
+
+    third, background_tasks = await _create(synthesis_engine)
+    assert third.status == "registered"
+    await background_tasks()
+    assert synthesis_engine.synthesize_cross_lingual_with_cache.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_delete_task_keeps_file_shared_with_other_tasks(store, synthesis_engine):
+    """Test the shared result file is removed only with the last task pointing at it"""
+    first, background_tasks = await _create(synthesis_engine)
+    await background_tasks()
+    second, _ = await _create(synthesis_engine)
+    content_hash = (await store.get(second.task_id))["content_hash"]
+
+    await tasks.delete_task(first.task_id)
+    assert os.path.exists(second.file_path)
+    assert await store.is_completed(content_hash)
+
+    await tasks.delete_task(second.task_id)
+    assert not os.path.exists(second.file_path)
+    assert not await store.is_completed(content_hash)
+
+
+@pytest.mark.asyncio
+async def test_delete_task_with_missing_file(store, synthesis_engine):
+    """Test deleting a task whose result file is already gone still succeeds"""
+    first, background_tasks = await _create(synthesis_engine)
+    await background_tasks()
+    content_hash = (await store.get(first.task_id))["content_hash"]
+    os.remove(first.file_path)
+
+    await tasks.delete_task(first.task_id)
+    assert await store.get(first.task_id) is None
+    assert not await store.is_completed(content_hash)
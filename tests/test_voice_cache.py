@@ -3,6 +3,7 @@ Tests for voice cache functionality
 """
 
 import pytest
+import pytest_asyncio
 import tempfile
 import shutil
 from pathlib import Path
@@ -11,7 +12,7 @@ from app.core.voice_cache import VoiceCache
 from app.models.voice import VoiceCreate, VoiceUpdate, VoiceType, AudioFormat
 
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def voice_cache():
     """Create a temporary voice cache for testing"""
     temp_dir = tempfile.mkdtemp()
@@ -207,3 +208,195 @@ async def test_voice_exists(voice_cache):
     # Should exist now
     exists = await voice_cache.voice_exists("test_exists")
     assert exists is True
+
+
+async def _add_voices(voice_cache, voices_data):
+    """Add (voice_id, name, voice_type, language) voices to the cache"""
+    for voice_id, name, voice_type, language in voices_data:
+        await voice_cache.add_voice(
+            voice_create=VoiceCreate(
+                voice_id=voice_id,
+                name=name,
+                voice_type=voice_type,
+                language=language,
+                audio_format=AudioFormat.WAV
+            ),
+            audio_file_path=f"/fake/path/{voice_id}.wav"
+        )
+
+
+def _ids(voices):
+    return [voice.voice_id for voice in voices]
+
+
+@pytest.mark.asyncio
+async def test_list_voices_filter_indexes(voice_cache):
+    """Test filtering by type, by language and by both"""
+    await _add_voices(voice_cache, [
+        ("voice_a", "A", VoiceType.ZERO_SHOT, "en"),
+        ("voice_b", "B", VoiceType.SFT, "en"),
+        ("voice_c", "C", VoiceType.ZERO_SHOT, "zh"),
+        ("voice_d", "D", VoiceType.CROSS_LINGUAL, None),
+    ])
+
+    voices, total = await voice_cache.list_voices(voice_type=VoiceType.ZERO_SHOT)
+    assert (_ids(voices), total) == (["voice_a", "voice_c"], 2)
+
+    voices, total = await voice_cache.list_voices(language="en")
+    assert (_ids(voices), total) == (["voice_a", "voice_b"], 2)
+
+    voices, total = await voice_cache.list_voices(voice_type=VoiceType.ZERO_SHOT, language="zh")
+    assert (_ids(voices), total) == (["voice_c"], 1)
+
+    voices, total = await voice_cache.list_voices(voice_type=VoiceType.SFT, language="zh")
+    assert (voices, total) == ([], 0)
+
+    voices, total = await voice_cache.list_voices(language="ja")
+    assert (voices, total) == ([], 0)
+
+
+@pytest.mark.asyncio
+async def test_list_voices_order_and_pagination(voice_cache):
+    """Test voices are listed by (name, voice_id) and paginated"""
+    await _add_voices(voice_cache, [
+        ("voice_3", "Charlie", VoiceType.ZERO_SHOT, "en"),
+        ("voice_2", "Alpha", VoiceType.ZERO_SHOT, "en"),
+        ("voice_1", "Bravo", VoiceType.ZERO_SHOT, "en"),
+        ("voice_0", "Bravo", VoiceType.ZERO_SHOT, "en"),
+    ])
+    expected = ["voice_2", "voice_0", "voice_1", "voice_3"]
+
+    voices, total = await voice_cache.list_voices()
+    assert (_ids(voices), total) == (expected, 4)
+
+    first, total = await voice_cache.list_voices(page=1, page_size=3)
+    second, _ = await voice_cache.list_voices(page=2, page_size=3)
+    beyond, _ = await voice_cache.list_voices(page=3, page_size=3)
+    assert total == 4
+    assert _ids(first) + _ids(second) == expected
+    assert beyond == []
+
+    # Filtered listings keep the same order
+    voices, total = await voice_cache.list_voices(voice_type=VoiceType.ZERO_SHOT, page=2, page_size=2)
+    assert (_ids(voices), total) == (expected[2:], 4)
+
+
+@pytest.mark.asyncio
+async def test_list_voices_after_update(voice_cache):
+    """Test the indexes follow language and name changes made by update_voice"""
+    await _add_voices(voice_cache, [
+        ("voice_a", "A", VoiceType.ZERO_SHOT, "en"),
+        ("voice_b", "B", VoiceType.ZERO_SHOT, "en"),
+    ])
+    # Build the cached listing order before updating
+    await voice_cache.list_voices()
+
+    await voice_cache.update_voice("voice_a", VoiceUpdate(language="zh", name="Z"))
+
+    voices, _ = await voice_cache.list_voices(language="en")
+    assert _ids(voices) == ["voice_b"]
+    voices, _ = await voice_cache.list_voices(language="zh")
+    assert _ids(voices) == ["voice_a"]
+    voices, _ = await voice_cache.list_voices(voice_type=VoiceType.ZERO_SHOT, language="zh")
+    assert _ids(voices) == ["voice_a"]
+    voices, _ = await voice_cache.list_voices()
+    assert _ids(voices) == ["voice_b", "voice_a"]
+
+
+@pytest.mark.asyncio
+async def test_list_voices_after_delete(voice_cache):
+    """Test deleted voices leave every index"""
+    await _add_voices(voice_cache, [
+        ("voice_a", "A", VoiceType.ZERO_SHOT, "en"),
+        ("voice_b", "B", VoiceType.ZERO_SHOT, "en"),
+    ])
+    await voice_cache.list_voices()
+
+    assert await voice_cache.delete_voice("voice_a") is True
+
+    voices, total = await voice_cache.list_voices()
+    assert (_ids(voices), total) == (["voice_b"], 1)
+    voices, total = await voice_cache.list_voices(voice_type=VoiceType.ZERO_SHOT)
+    assert (_ids(voices), total) == (["voice_b"], 1)
+    voices, total = await voice_cache.list_voices(language="en")
+    assert (_ids(voices), total) == (["voice_b"], 1)
+
+
+@pytest.mark.asyncio
+async def test_indexes_rebuilt_on_initialize(voice_cache):
+    """Test a cache loaded from disk filters like the one that saved it"""
+    await _add_voices(voice_cache, [
+        ("voice_a", "A", VoiceType.ZERO_SHOT, "en"),
+        ("voice_b", "B", VoiceType.SFT, "zh"),
+    ])
+
+    reloaded = VoiceCache(str(voice_cache.cache_dir), str(voice_cache.db_file))
+    await reloaded.initialize()
+
+    voices, _ = await reloaded.list_voices(voice_type=VoiceType.SFT)
+    assert _ids(voices) == ["voice_b"]
+    voices, _ = await reloaded.list_voices(language="en")
+    assert _ids(voices) == ["voice_a"]
+
+
+async def _add_enrolled_voice(voice_cache, voice_id, audio_hash, prompt_text="Hello world", model_data=None):
+    """Add a zero-shot voice enrolled from audio with the given hash"""
+    return await voice_cache.add_voice(
+        voice_create=VoiceCreate(
+            voice_id=voice_id,
+            name=voice_id,
+            voice_type=VoiceType.ZERO_SHOT,
+            prompt_text=prompt_text,
+            audio_format=AudioFormat.WAV
+        ),
+        audio_file_path=f"/fake/path/{voice_id}.wav",
+        model_data=model_data,
+        audio_hash=audio_hash
+    )
+
+
+@pytest.mark.asyncio
+async def test_find_by_audio_hash(voice_cache):
+    """Test finding an enrolled voice by audio hash and prompt text"""
+    await _add_enrolled_voice(voice_cache, "voice_a", "hash_a", model_data={"embedding": [0.1]})
+
+    voice = await voice_cache.find_by_audio_hash("hash_a", "Hello world")
+    assert voice is not None
+    assert voice.voice_id == "voice_a"
+    assert await voice_cache.find_by_audio_hash("hash_b", "Hello world") is None
+
+
+@pytest.mark.asyncio
+async def test_find_by_audio_hash_prompt_text_mismatch(voice_cache):
+    """Test the same audio with a different prompt text is not a match"""
+    await _add_enrolled_voice(voice_cache, "voice_a", "hash_a", model_data={"embedding": [0.1]})
+
+    assert await voice_cache.find_by_audio_hash("hash_a", "Goodbye world") is None
+    assert await voice_cache.find_by_audio_hash("hash_a", None) is None
+
+    await _add_enrolled_voice(voice_cache, "voice_b", "hash_a", prompt_text="Goodbye world",
+                              model_data={"embedding": [0.2]})
+    voice = await voice_cache.find_by_audio_hash("hash_a", "Goodbye world")
+    assert voice is not None
+    assert voice.voice_id == "voice_b"
+
+
+@pytest.mark.asyncio
+async def test_find_by_audio_hash_requires_model_data(voice_cache):
+    """Test voices without model data are skipped until it is stored"""
+    await _add_enrolled_voice(voice_cache, "voice_a", "hash_a")
+    assert await voice_cache.find_by_audio_hash("hash_a", "Hello world") is None
+
+    await voice_cache.update_voice_model_data("voice_a", {"embedding": [0.1]})
+    voice = await voice_cache.find_by_audio_hash("hash_a", "Hello world")
+    assert voice is not None
+    assert voice.voice_id == "voice_a"
+
+
+@pytest.mark.asyncio
+async def test_find_by_audio_hash_after_delete(voice_cache):
+    """Test deleted voices are no longer found by audio hash"""
+    await _add_enrolled_voice(voice_cache, "voice_a", "hash_a", model_data={"embedding": [0.1]})
+
+    assert await voice_cache.delete_voice("voice_a") is True
+    assert await voice_cache.find_by_audio_hash("hash_a", "Hello world") is None